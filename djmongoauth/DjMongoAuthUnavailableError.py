@@ -0,0 +1,6 @@
+from .DjMongoAuthError import DjMongoAuthError
+
+# the operation could not be carried out right now (password hashing back-pressure, a database error); unlike
+# other DjMongoAuthErrors it says nothing about the request itself and may succeed when retried
+class DjMongoAuthUnavailableError(DjMongoAuthError):
+    pass
@@ -1 +1,3 @@
-__version__ = "0.0.1"
\ No newline at end of file
+__version__ = "0.0.1"
+
+default_app_config = "djmongoauth.apps.DjmongoauthConfig"
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class DjmongoauthConfig(AppConfig):
     name = 'djmongoauth'
+
+    def ready(self):
+        from .common.RevocationList import check_revocation_list
+        from .common.Warmup import warm_up_from_settings
+        check_revocation_list()
+        warm_up_from_settings()
@@ -0,0 +1,29 @@
+from django.conf import settings
+
+from .Email import Email
+from .EmailUtils import send_email, to_message
+
+try:
+    import aiosmtplib
+except ImportError:
+    aiosmtplib = None
+
+SMTP_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+
+async def asend_email(email:Email):
+    # with the SMTP backend and aiosmtplib installed the message is sent on the event loop; any other
+    # backend (locmem, console, file, ...) goes through Django's mail API in a worker thread
+    if aiosmtplib is None or settings.EMAIL_BACKEND != SMTP_BACKEND:
+        from asgiref.sync import sync_to_async
+        await sync_to_async(send_email)(email)
+        return
+    await aiosmtplib.send(
+        to_message(email).message(),
+        hostname=settings.EMAIL_HOST,
+        port=settings.EMAIL_PORT,
+        username=settings.EMAIL_HOST_USER or None,
+        password=settings.EMAIL_HOST_PASSWORD or None,
+        use_tls=settings.EMAIL_USE_SSL,
+        start_tls=settings.EMAIL_USE_TLS,
+        timeout=settings.EMAIL_TIMEOUT
+    )
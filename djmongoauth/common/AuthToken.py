@@ -0,0 +1,66 @@
+import re
+from operator import itemgetter
+
+from django.conf import settings
+
+from ..DjMongoAuthError import DjMongoAuthError
+
+MAX_LENGTH = 1024  # Session.x_auth_token max_length
+REQUEST_ATTRIBUTE = "_djmongoauth_token"
+
+# exp=<int>&user_id=<ObjectId>&username=<str>&session_key=<str>[&sig=<HMAC-SHA256 hex>]
+# matched in one pass by the regex engine; anything else, including stray fields, is rejected
+TOKEN_PATTERN = re.compile(
+    r"exp=(\d{1,12})&user_id=([0-9a-f]{24})&username=([^&]*)&session_key=([^&]+)(?:&sig=[0-9a-f]{64})?",
+    re.ASCII
+)
+
+# tokens parsed recently in this process: a client sends the same token with every request, so most parses
+# are a dict lookup; cleared when full, and shared by every thread since an AuthToken is immutable
+CACHE_SIZE = getattr(settings, "DJMONGOAUTH_TOKEN_CACHE_SIZE", 4096)
+_parsed = {}
+
+# a parsed x_auth_token; a tuple subclass like namedtuple, so it is immutable, has no per-instance
+# __dict__ and is created in a single allocation
+class AuthToken(tuple):
+    __slots__ = ()
+
+    exp = property(itemgetter(0))
+    user_id = property(itemgetter(1))
+    username = property(itemgetter(2))
+    session_key = property(itemgetter(3))
+    raw = property(itemgetter(4))
+
+    def __repr__(self):
+        # the session key is a credential and stays out of logs
+        return "AuthToken(exp={}, user_id={}, username={})".format(self.exp, self.user_id, self.username)
+
+    @staticmethod
+    def parse(x_auth_token:str)->"AuthToken":
+        token = _parsed.get(x_auth_token)
+        if token is not None:
+            return token
+        # other Authorization schemes are rejected without running the pattern
+        match = TOKEN_PATTERN.fullmatch(x_auth_token) \
+            if x_auth_token and x_auth_token.startswith("exp=") and len(x_auth_token) <= MAX_LENGTH else None
+        if match is None:
+            raise DjMongoAuthError("Failed to parse x_auth_token: " + str(x_auth_token))
+        exp, user_id, username, session_key = match.groups()
+        token = tuple.__new__(AuthToken, (int(exp), user_id, username, session_key, x_auth_token))
+        if CACHE_SIZE:
+            if len(_parsed) >= CACHE_SIZE:
+                _parsed.clear()
+            _parsed[x_auth_token] = token
+        return token
+
+    @staticmethod
+    def from_request(request)->"AuthToken":
+        # parsed once per request; the cached token is dropped if the header changes
+        x_auth_token = request.META.get("HTTP_AUTHORIZATION")
+        if not x_auth_token:
+            raise DjMongoAuthError("No token found in request header!")
+        token = getattr(request, REQUEST_ATTRIBUTE, None)
+        if token is None or token.raw != x_auth_token:
+            token = AuthToken.parse(x_auth_token)
+            setattr(request, REQUEST_ATTRIBUTE, token)
+        return token
@@ -0,0 +1,306 @@
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from bson.objectid import ObjectId
+from django.contrib.auth.hashers import check_password
+from django.test import RequestFactory, override_settings
+
+from ..models import User, Session, TemporaryAuthenticator
+from ..decorators.authenticated import authenticated
+from ..sessions import get_session_store
+from ..sessions.MongoSessionStore import MongoSessionStore
+from ..sessions.MemorySessionStore import MemorySessionStore
+from ..sessions.MmapSessionStore import MmapSessionStore
+from .EmailTypes import EmailTypes
+from .Instrumentation import instrumentation
+from .AuthToken import AuthToken, CACHE_SIZE as AUTH_TOKEN_CACHE_SIZE
+
+class OperationStats():
+    def __init__(self, name:str):
+        self.name = name
+        self.latencies = []
+        self.queries = 0
+        self.errors = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency:float, queries:int, failed:bool):
+        with self._lock:
+            self.latencies.append(latency)
+            self.queries += queries
+            self.errors += failed
+
+    def percentile(self, p:float)->float:
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))]
+
+    def summary(self)->dict:
+        count = len(self.latencies)
+        return {
+            "operation": self.name,
+            "count": count,
+            "errors": self.errors,
+            "throughput": count / self.elapsed if self.elapsed else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "queries_per_op": self.queries / count if count else 0.0
+        }
+
+class _QueryCounter():
+    # instrumentation sink remembering the query count of the last operation finished in each thread
+    def __init__(self):
+        self._local = threading.local()
+
+    def emit(self, record):
+        self._local.queries = record.queries
+
+    def pop(self)->int:
+        queries = getattr(self._local, "queries", 0)
+        self._local.queries = 0
+        return queries
+
+@authenticated()
+def _authenticated_view(request):
+    return None
+
+class AuthBenchmark():
+    # drives the public auth flows end to end against the configured database and mail backend
+    PASSWORD = "benchmark-password"
+
+    def __init__(self, users:int, concurrency:int):
+        self.users = users
+        self.concurrency = concurrency
+        self.prefix = "bench_{}_".format(uuid.uuid4().hex[:8])
+        self.factory = RequestFactory()
+        self.tokens = {}
+        self.authenticators = {}
+        self.results = []
+        self.query_counter = _QueryCounter()
+
+    def run(self)->list:
+        instrumentation.sinks.append(self.query_counter)
+        with override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"):
+            try:
+                self._measure("register", self._register)
+                self._measure("login", self._login)
+                self._measure("authenticated", self._authenticated)
+                self._measure("send_email", self._send_email)
+                self._load_authenticators()
+                self._measure("handle_email_request", self._handle_email_request)
+                self._measure("logout", self._logout)
+            finally:
+                instrumentation.sinks.remove(self.query_counter)
+                self._cleanup()
+        return self.results
+
+    def stress_login(self, attempts:int)->dict:
+        # logs one user in from `concurrency` threads at once; every attempt should get the same session
+        with override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"):
+            try:
+                self._register(0)
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    tokens = list(executor.map(lambda _: User.login(self._username(0), self.PASSWORD), range(attempts)))
+                user_id = Session.parse_x_auth_token(tokens[0])[1]
+                return {
+                    "attempts": attempts,
+                    "distinct_tokens": len(set(tokens)),
+                    "session_documents": len(get_session_store().get_active_sessions(user_id))
+                }
+            finally:
+                self._cleanup()
+
+    def stress_email_request(self, attempts:int)->dict:
+        # submits one password reset link `attempts` times from `concurrency` threads at once; exactly one
+        # attempt should succeed and the password should be the one that attempt submitted
+        with override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"):
+            try:
+                self._register(0)
+                self._login(0)
+                User.send_email(self._auth_request(0, "post"), type=EmailTypes.RESET)
+                user_id = AuthToken.parse(self.tokens[0]).user_id
+                authenticator = TemporaryAuthenticator.objects.filter(user_id=user_id).first().authenticator
+
+                def attempt(i):
+                    request = self.factory.put(
+                        "/?a={}".format(authenticator),
+                        data=json.dumps({"new_password": "{}{}".format(self.PASSWORD, i)}),
+                        content_type="application/json"
+                    )
+                    try:
+                        User.handle_email_request(request, EmailTypes.RESET)
+                        return i
+                    except Exception:
+                        return None
+
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    winners = [i for i in executor.map(attempt, range(attempts)) if i is not None]
+                password_applied = len(winners) == 1 and check_password(
+                    "{}{}".format(self.PASSWORD, winners[0]),
+                    User.objects.get(username=self._username(0)).password
+                )
+                return {
+                    "attempts": attempts,
+                    "succeeded": len(winners),
+                    "password_applied": password_applied,
+                    "authenticators_left": TemporaryAuthenticator.objects.filter(user_id=user_id).count()
+                }
+            finally:
+                self._cleanup()
+
+    def _measure(self, name:str, operation):
+        stats = OperationStats(name)
+
+        def task(i):
+            start = time.perf_counter()
+            failed = False
+            try:
+                operation(i)
+            except Exception:
+                failed = True
+            stats.record(time.perf_counter() - start, self.query_counter.pop(), failed)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(task, range(self.users)))
+        stats.elapsed = time.perf_counter() - start
+        self.results.append(stats.summary())
+
+    def _username(self, i:int)->str:
+        return "{}{}".format(self.prefix, i)
+
+    def _auth_request(self, i:int, method:str="get", **kwargs):
+        return getattr(self.factory, method)("/", HTTP_AUTHORIZATION=self.tokens[i], **kwargs)
+
+    def _register(self, i:int):
+        user = User()
+        user.username = self._username(i)
+        user.email = "{}@example.com".format(self._username(i))
+        user.password = self.PASSWORD
+        user.register()
+
+    def _login(self, i:int):
+        self.tokens[i] = User.login(self._username(i), self.PASSWORD)
+
+    def _authenticated(self, i:int):
+        _authenticated_view(self._auth_request(i))
+
+    def _send_email(self, i:int):
+        User.send_email(self._auth_request(i, "post"), type=EmailTypes.VERIFY)
+
+    def _load_authenticators(self):
+        for i in range(self.users):
+            user_id = Session.parse_x_auth_token(self.tokens[i])[1]
+            temp_auth = TemporaryAuthenticator.objects.filter(user_id=user_id).first()
+            if temp_auth:
+                self.authenticators[i] = temp_auth.authenticator
+
+    def _handle_email_request(self, i:int):
+        request = self.factory.put("/?a={}".format(self.authenticators[i]), data=json.dumps({}), content_type="application/json")
+        User.handle_email_request(request, EmailTypes.VERIFY)
+
+    def _logout(self, i:int):
+        User.logout(self._auth_request(i, "post"))
+
+    def _cleanup(self):
+        users = User.objects.filter(username__startswith=self.prefix)
+        user_ids = [str(user._id) for user in users]
+        get_session_store().delete_sessions_of_users(user_ids)
+        TemporaryAuthenticator.objects.filter(user_id__in=user_ids).delete()
+        users.delete()
+
+def _legacy_parse_x_auth_token(x_auth_token:str)->tuple:
+    # Session.parse_x_auth_token before AuthToken, kept as the baseline for benchmark_token_parsing
+    tokens = x_auth_token.split("&")
+    if len(tokens) < 3:
+        raise ValueError("Failed to parse x_auth_token: {}".format(x_auth_token))
+    return (
+        tokens[0].split("=")[1],
+        tokens[1].split("=")[1],
+        tokens[2].split("=")[1],
+        tokens[3].split("=")[1]
+    )
+
+def benchmark_token_parsing(iterations:int)->list:
+    # (case, ns per call) for the old parser, AuthToken.parse of a token seen before and of new ones, the
+    # per-request cache and malformed input
+    tokens = [
+        "exp=1700000000&user_id=5f1d7a3c9b1e8a2d4c6f0b1a&username=benchmark{}&session_key={}&sig={}".format(
+            i, "k" * 171, "0" * 64
+        ) for i in range(2 * max(AUTH_TOKEN_CACHE_SIZE, 1))
+    ]
+    token = tokens[0]
+    # cycling through twice as many tokens as the parse cache holds, every one is new to it
+    new_tokens = itertools.cycle(tokens)
+    request = RequestFactory().get("/", HTTP_AUTHORIZATION=token)
+    malformed = "Basic dXNlcjpwYXNzd29yZA=="
+
+    def reject(parse):
+        def call():
+            try:
+                parse(malformed)
+            except Exception:
+                pass
+        return call
+
+    cases = [
+        ("legacy parse", lambda: _legacy_parse_x_auth_token(token)),
+        ("AuthToken.parse", lambda: AuthToken.parse(token)),
+        ("legacy parse (new tokens)", lambda: _legacy_parse_x_auth_token(next(new_tokens))),
+        ("AuthToken.parse (new tokens)", lambda: AuthToken.parse(next(new_tokens))),
+        ("AuthToken.from_request (cached)", lambda: AuthToken.from_request(request)),
+        ("legacy reject malformed", reject(_legacy_parse_x_auth_token)),
+        ("AuthToken reject malformed", reject(AuthToken.parse))
+    ]
+    results = []
+    for name, call in cases:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            call()
+        results.append((name, (time.perf_counter() - start) / iterations * 1e9))
+    return results
+
+def benchmark_session_stores(sessions:int)->list:
+    # (store, operation, us per call) for every session store backend, driven directly without the auth flows
+    path = os.path.join(tempfile.mkdtemp(), "sessions")
+    stores = [
+        ("mongo", MongoSessionStore()),
+        ("memory", MemorySessionStore()),
+        ("mmap", MmapSessionStore(path=path, slots=max(1024, sessions * 2)))
+    ]
+    results = []
+    try:
+        for name, store in stores:
+            new_sessions = [_benchmark_session(i) for i in range(sessions)]
+            # second logins of the same users, which get the sessions created first
+            logins = [_benchmark_session(i, session.user_id) for i, session in enumerate(new_sessions)]
+            operations = [
+                ("create", lambda i: store.get_or_create_session(new_sessions[i])),
+                ("get_or_create (existing)", lambda i: store.get_or_create_session(logins[i])),
+                ("get_active_session", lambda i: store.get_active_session(user_id=new_sessions[i].user_id, session_key=new_sessions[i].session_key)),
+                ("delete_sessions", lambda i: store.delete_sessions(new_sessions[i].user_id))
+            ]
+            for operation, call in operations:
+                start = time.perf_counter()
+                for i in range(sessions):
+                    call(i)
+                results.append((name, operation, (time.perf_counter() - start) / sessions * 1e6))
+    finally:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    return results
+
+def _benchmark_session(i:int, user_id:str=None)->Session:
+    session = Session()
+    session.user_id = user_id or str(ObjectId())
+    session.set_expires_at()
+    session.generate_session_key()
+    session.generate_x_auth_token(username="benchmark_{}".format(i))
+    return session
@@ -0,0 +1,98 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+from ..models import User
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ("username", "email", "password")
+
+class InvalidRecord(dict):
+    # stands in for a JSON line that could not be read, so import_users reports it under its record number
+    def __init__(self, error:str):
+        super().__init__()
+        self.error = error
+
+class ImportResult():
+    def __init__(self):
+        self.processed = 0
+        self.inserted = 0
+        # (record number, username, error) for every record that was not imported
+        self.errors = []
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self)->float:
+        return time.perf_counter() - self.started
+
+    @property
+    def throughput(self)->float:
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+def read_records(file, format:str):
+    # streams dicts from an open text file, one per CSV row (with a header) or JSON line
+    if format == "csv":
+        yield from csv.DictReader(file)
+    elif format == "jsonl":
+        for line in file:
+            if line.strip():
+                yield _parse_line(line)
+    else:
+        raise ValueError("Unknown format {}, expected one of {}".format(format, ", ".join(FORMATS)))
+
+def import_users(records, batch_size:int=1000, hashed_passwords:bool=False, progress=None)->ImportResult:
+    # progress(result) is called after every batch
+    result = ImportResult()
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        users = []
+        numbers = []
+        for number, record in enumerate(batch, start=result.processed + 1):
+            try:
+                users.append(_to_user(record))
+                numbers.append(number)
+            except ValueError as e:
+                result.errors.append((number, record.get("username"), str(e)))
+        if users:
+            errors = User.bulk_register(users, hash_passwords=not hashed_passwords)
+            for index, error in errors:
+                result.errors.append((numbers[index], users[index].username, error))
+            result.inserted += len(users) - len(errors)
+        result.processed += len(batch)
+        if progress:
+            progress(result)
+    return result
+
+def _parse_line(line:str)->dict:
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return InvalidRecord("Invalid JSON: {}".format(e))
+    if not isinstance(record, dict):
+        return InvalidRecord("Expected a JSON object, got {}".format(type(record).__name__))
+    return record
+
+def _to_user(record:dict)->User:
+    if isinstance(record, InvalidRecord):
+        raise ValueError(record.error)
+    missing = [name for name in FIELDS if not record.get(name)]
+    if missing:
+        raise ValueError("Missing {}".format(", ".join(missing)))
+    try:
+        validate_email(record["email"])
+    except ValidationError:
+        raise ValueError("Invalid email {}".format(record["email"]))
+    verified = User._verified_fields() if str(record.get("email_verified", "")).lower() in ("1", "true", "yes") else {}
+    return User(
+        username=record["username"],
+        email=record["email"],
+        password=record["password"],
+        **verified
+    )
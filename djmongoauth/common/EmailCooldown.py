@@ -0,0 +1,54 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .EmailTypes import EmailTypes
+
+# per user and EmailTypes cooldown for send_email: a bounded in-process record of recent sends answers
+# repeated requests without touching MongoDB; the authenticator collection is the cross-process fallback
+class EmailCooldown():
+    OUTCOMES = ("sent", "reused", "suppressed")
+
+    def __init__(self, cooldown:int, max_size:int):
+        self.cooldown = cooldown
+        self.max_size = max_size
+        self._last_sent = OrderedDict()    # (user_id, type value) -> time.time() of the last send
+        self._counters = {t.value: dict.fromkeys(self.OUTCOMES, 0) for t in EmailTypes}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self)->bool:
+        return self.cooldown > 0
+
+    def is_cooling_down(self, user_id:str, type:EmailTypes, now:float=None)->bool:
+        if not self.enabled:
+            return False
+        now = now if now is not None else time.time()
+        with self._lock:
+            last_sent = self._last_sent.get((user_id, type.value))
+            return last_sent is not None and now - last_sent < self.cooldown
+
+    def remember(self, user_id:str, type:EmailTypes, sent_at:float=None):
+        if not self.enabled:
+            return
+        key = (user_id, type.value)
+        with self._lock:
+            self._last_sent.pop(key, None)
+            self._last_sent[key] = sent_at if sent_at is not None else time.time()
+            while len(self._last_sent) > self.max_size:
+                self._last_sent.popitem(last=False)
+
+    def record(self, type:EmailTypes, outcome:str):
+        with self._lock:
+            self._counters[type.value][outcome] += 1
+
+    def metrics(self)->dict:
+        with self._lock:
+            return {type: dict(counters) for type, counters in self._counters.items()}
+
+email_cooldown = EmailCooldown(
+    cooldown=getattr(settings, "DJMONGOAUTH_EMAIL_COOLDOWN", 60),
+    max_size=getattr(settings, "DJMONGOAUTH_EMAIL_COOLDOWN_SIZE", 10000)
+)
@@ -1,4 +1,11 @@
+import os
+
 from django.conf import settings
+from django.template import Context, Engine, TemplateDoesNotExist
+from django.template.base import TextNode, Variable, VariableNode
+from django.template.defaulttags import AutoEscapeControlNode
+from django.template.loader import get_template
+from django.utils.html import escape
 from .EmailTypes import EmailTypes
 
 from .Email import Email
@@ -9,91 +16,135 @@ class EmailFactory():
     EMAIL_HOST_USER = settings.EMAIL_HOST_USER
     PASSWORD_RESET_EMAIL_SUBJECT = "Reset your password on {}".format(SITE_URL)
     VERIFY_EMAIL_SUBJECT = "Verify your e-mail to finish signing up for {}".format(SITE_URL)
+    BASE_URL = "{}://{}".format("https" if IS_HTTPS else "http", SITE_URL)
+    TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+    # email type -> (subject, link path, template name without extension)
+    EMAILS = {
+        EmailTypes.VERIFY: (VERIFY_EMAIL_SUBJECT, "verify", "djmongoauth/email/verify"),
+        EmailTypes.RESET: (PASSWORD_RESET_EMAIL_SUBJECT, "reset", "djmongoauth/email/reset")
+    }
+    # the variables every email template is rendered with
+    FIELDS = ("username", "site_url", "link", "expires_at")
+    # templates are loaded and compiled once per process: email type -> (text template, html template)
+    _templates = {}
+    # renders djmongoauth's own templates when no engine of the TEMPLATES setting finds them
+    _engine = None
 
     def __init__(self, **kwargs):
         pass 
 
     @staticmethod
     def generate_email(type:str, **kwargs):
-        if type == EmailTypes.RESET:
-            return EmailFactory._generate_password_reset_email(**kwargs)
-        elif type == EmailTypes.VERIFY:
-            return EmailFactory._generate_verify_email(**kwargs)
-        return None
-
-    @staticmethod
-    def _generate_verify_email(**kwargs):
+        if type not in EmailFactory.EMAILS:
+            return None
         assert kwargs.get("temp_auth")
         assert kwargs.get("user")
-        temp_auth = kwargs["temp_auth"]
-        user = kwargs["user"]
-        verify_link = "{}/verify?a={}".format(
-            "{}://{}".format(
-                "https" if EmailFactory.IS_HTTPS else "http",
-                EmailFactory.SITE_URL
-            ),
-            temp_auth.authenticator
-        )
-        expires_at = temp_auth.expires_at.strftime("%Y-%m-%d %H:%M:%S")
-        html_message = """
-        <p>Hello {username}:</p><p><br></p><p>Please use the following link to verify your email address on {site_url}</p><p>{verify_link}</p><p>This link will expire on {expires_at} UTC</p><p>Thank you for using {site_url}!</p>
-        """.format(
-            username=user.username,
-            site_url=EmailFactory.SITE_URL,
-            verify_link=verify_link,
-            expires_at=expires_at
-        )
-        text_message = """
-        Hello {username}, please use this link to verify your email address on {site_url}: {verify_link} This link will expire on {expires_at} UTC. Thank you for using {site_url}!
-        """.format(
-            username=user.username,
-            site_url=EmailFactory.SITE_URL,
-            verify_link=verify_link,
-            expires_at=expires_at
-        )
-        return Email(
-            subject=EmailFactory.VERIFY_EMAIL_SUBJECT,
-            text_message=text_message,
-            html_message=html_message,
-            from_email=EmailFactory.EMAIL_HOST_USER,
-            to_email=user.email
-        )
+        return EmailFactory.generate_emails(type, [(kwargs["user"], kwargs["temp_auth"])])[0]
+
+    @staticmethod
+    def generate_emails(type:EmailTypes, recipients)->list:
+        # recipients: iterable of (user, temp_auth); templates and constant fields are shared by the whole batch
+        subject, path, _ = EmailFactory.EMAILS[type]
+        text_template, html_template = EmailFactory.get_templates(type)
+        link_prefix = "{}/{}?a=".format(EmailFactory.BASE_URL, path)
+        emails = []
+        for user, temp_auth in recipients:
+            fields = {
+                "username": user.username,
+                "site_url": EmailFactory.SITE_URL,
+                "link": link_prefix + temp_auth.authenticator,
+                "expires_at": temp_auth.expires_at.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            emails.append(Email(
+                subject=subject,
+                text_message=text_template.render(fields).strip(),
+                html_message=html_template.render(fields).strip(),
+                from_email=EmailFactory.EMAIL_HOST_USER,
+                to_email=user.email
+            ))
+        return emails
+
+    @staticmethod
+    def get_templates(type:EmailTypes)->tuple:
+        templates = EmailFactory._templates.get(type)
+        if templates is None:
+            name = EmailFactory.EMAILS[type][2]
+            templates = (
+                EmailFactory._load_template(name + ".txt"),
+                EmailFactory._load_template(name + ".html")
+            )
+            EmailFactory._templates[type] = templates
+        return templates
 
     @staticmethod
-    def _generate_password_reset_email(**kwargs):
-        assert kwargs.get("user", None)
-        assert kwargs.get("temp_auth", None)
-        user = kwargs["user"]
-        temp_auth = kwargs["temp_auth"]
-        reset_link = "{}/reset?a={}".format(
-            "{}://{}".format(
-                "https" if EmailFactory.IS_HTTPS else "http",
-                EmailFactory.SITE_URL
-            ),
-            temp_auth.authenticator
-        )
-        expires_at = temp_auth.expires_at.strftime("%Y-%m-%d %H:%M:%S")
-        html_message = """
-        <p>Hello {username},</p><p><br></p><p>A request has been received to change the password for your account on {site_url}</p><p>Please follow this link to reset your password: {reset_link}</p><p>This link will expire on {expires_at} UTC</p><p>If you did not initiate this request, please ignore this email. </p>
-        """.format(
-            username=user.username,
-            site_url=EmailFactory.SITE_URL,
-            reset_link=reset_link,
-            expires_at=expires_at
-        )
-        text_message = """
-        Hello {username}, a request has been received to change the password for your account on UnreadLetters. Please follow this link to reset your password: {reset_link}. This link will expire on {expires_at} UTC. If you did not initiate this request, please ignore this email.
-        """.format(
-            username=user.username,
-            reset_link=reset_link,
-            expires_at=expires_at
-        )
-        return Email(
-            subject=EmailFactory.PASSWORD_RESET_EMAIL_SUBJECT,
-            text_message=text_message,
-            html_message=html_message,
-            from_email=EmailFactory.EMAIL_HOST_USER,
-            to_email=user.email
-        )
+    def _load_template(name:str):
+        # a project template with the same name (found through the TEMPLATES setting) overrides the one shipped
+        # with djmongoauth; templates made of text and plain {{ variables }}, like the shipped ones, are rendered
+        # with str.format_map, any other by its own engine
+        try:
+            template = get_template(name)
+            compiled = getattr(template, "template", None)
+        except TemplateDoesNotExist:
+            if EmailFactory._engine is None:
+                EmailFactory._engine = Engine(dirs=[EmailFactory.TEMPLATE_DIR])
+            compiled = EmailFactory._engine.get_template(name)
+            template = _EngineTemplate(compiled)
+        return (compiled is not None and _FormatTemplate.compile(compiled, EmailFactory.FIELDS)) or template
 
+class _EngineTemplate():
+    # the render(dict) interface of templates returned by get_template()
+    def __init__(self, template):
+        self.template = template
+
+    def render(self, context:dict)->str:
+        return self.template.render(Context(context))
+
+class _FormatTemplate():
+    # a compiled Django template turned into one format string; renders the same text for string values
+    # the replacements of django.utils.html.escape, "&" first, applied without its lazy string and SafeText wrapping
+    HTML_ESCAPES = tuple((c, str(escape(c))) for c in "&<>\"'")
+
+    def __init__(self, format_string:str, escaped:set):
+        self.format_string = format_string
+        self.escaped = escaped
+
+    @staticmethod
+    def compile(template, names:tuple):
+        # None unless the template only holds text, autoescape blocks and the variables in names without filters
+        parts = []
+        escaped = set()
+        if not _FormatTemplate._convert(template.nodelist, template.engine.autoescape, names, parts, escaped):
+            return None
+        return _FormatTemplate("".join(parts), escaped)
+
+    @staticmethod
+    def _convert(nodelist, autoescape:bool, names:tuple, parts:list, escaped:set)->bool:
+        for node in nodelist:
+            if isinstance(node, TextNode):
+                parts.append(node.s.replace("{", "{{").replace("}", "}}"))
+            elif isinstance(node, AutoEscapeControlNode):
+                if not _FormatTemplate._convert(node.nodelist, node.setting, names, parts, escaped):
+                    return False
+            elif isinstance(node, VariableNode):
+                variable = node.filter_expression.var
+                if node.filter_expression.filters or not isinstance(variable, Variable) or variable.literal is not None \
+                        or len(variable.lookups) != 1 or variable.lookups[0] not in names:
+                    return False
+                name = variable.lookups[0]
+                if autoescape:
+                    escaped.add(name)
+                    name = "escaped_" + name
+                parts.append("{" + name + "}")
+            else:
+                return False
+        return True
 
+    def render(self, context:dict)->str:
+        if self.escaped:
+            context = dict(context)
+            for name in self.escaped:
+                value = str(context[name])
+                for c, replacement in _FormatTemplate.HTML_ESCAPES:
+                    value = value.replace(c, replacement)
+                context["escaped_" + name] = value
+        return self.format_string.format_map(context)
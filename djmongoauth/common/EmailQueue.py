@@ -0,0 +1,112 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .Email import Email
+from .SMTPConnectionPool import smtp_pool
+
+logger = logging.getLogger(__name__)
+
+# seconds a process exiting normally waits for queued emails to be sent
+SHUTDOWN_TIMEOUT = getattr(settings, "DJMONGOAUTH_EMAIL_SHUTDOWN_TIMEOUT", 10.0)
+
+# outbound mail is handed to a pool of daemon threads so SMTP latency stays out of the request thread
+# the queue lives in memory only: emails still queued when the process is killed, crashes or exceeds
+# shutdown_timeout at exit are lost (and logged when the exit is a normal one)
+class EmailQueue():
+    def __init__(self, workers:int, max_retries:int, backoff:float, sender=smtp_pool.send_email,
+            shutdown_timeout:float=SHUTDOWN_TIMEOUT):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sender = sender
+        self.shutdown_timeout = shutdown_timeout
+        self.sent = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, email:Email):
+        self._ensure_started()
+        self._queue.put(email)
+
+    def join(self, timeout:float=None)->bool:
+        # blocks until every enqueued email has been sent or given up on, or until timeout seconds have passed;
+        # returns whether the queue was drained
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        # once per process: a forked worker inherits neither the threads of its parent nor, so that they are
+        # not sent twice, the emails it had queued
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self._queue = queue.Queue()
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name="djmongoauth-email-{}".format(i), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self._pid is None:
+                atexit.register(self._flush)
+            self._pid = os.getpid()
+
+    def _flush(self):
+        # at interpreter exit, before the daemon threads are stopped
+        if self._pid != os.getpid() or not self._queue.unfinished_tasks:
+            return
+        logger.info("Sending %d queued emails before exiting", self._queue.unfinished_tasks)
+        if not self.join(self.shutdown_timeout):
+            logger.error(
+                "%d queued emails not sent within %.1fs of exiting, they are lost",
+                self._queue.unfinished_tasks, self.shutdown_timeout
+            )
+
+    def _run(self):
+        while True:
+            email = self._queue.get()
+            try:
+                self._deliver(email)
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, email:Email):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.sender(email)
+                with self._lock:
+                    self.sent += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.failed += 1
+                    logger.error("Giving up on email to %s after %d attempts: %s", email.to_email, attempt + 1, e)
+                    return
+                delay = self.backoff * 2 ** attempt
+                logger.warning("Failed to send email to %s (%s), retrying in %.1fs", email.to_email, e, delay)
+                time.sleep(delay)
+
+ASYNC_EMAIL = getattr(settings, "DJMONGOAUTH_ASYNC_EMAIL", False)
+
+# any class with the same constructor and enqueue() / join() can be plugged in
+email_queue = import_string(getattr(settings, "DJMONGOAUTH_EMAIL_QUEUE", "djmongoauth.common.EmailQueue.EmailQueue"))(
+    workers=getattr(settings, "DJMONGOAUTH_EMAIL_WORKERS", 2),
+    max_retries=getattr(settings, "DJMONGOAUTH_EMAIL_MAX_RETRIES", 3),
+    backoff=getattr(settings, "DJMONGOAUTH_EMAIL_RETRY_BACKOFF", 1.0)
+)
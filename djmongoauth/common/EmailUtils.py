@@ -1,4 +1,4 @@
-from django.core.mail import send_mail
+from django.core.mail import send_mail, EmailMultiAlternatives
 from .Email import Email
 
 def send_email(email:Email):
@@ -9,3 +9,15 @@ def send_email(email:Email):
         recipient_list=[email.to_email],
         html_message=email.html_message
     )
+
+def to_message(email:Email, connection=None)->EmailMultiAlternatives:
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.text_message,
+        from_email=email.from_email,
+        to=[email.to_email],
+        connection=connection
+    )
+    if email.html_message:
+        message.attach_alternative(email.html_message, "text/html")
+    return message
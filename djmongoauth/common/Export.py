@@ -0,0 +1,136 @@
+import csv
+import json
+import sys
+from datetime import datetime, timedelta
+from itertools import islice
+
+from bson.objectid import ObjectId
+from django.utils import timezone
+
+from ..models import User, Session
+from ..sessions import get_session_store
+from ..sessions.MemorySessionStore import MemorySessionStore
+from ..sessions.MongoSessionStore import MongoSessionStore
+from .MongoUtils import get_collection, to_mongo_value
+
+FORMATS = ("jsonl", "csv")
+
+# exported fields; password hashes, session keys and tokens never leave the database
+USER_FIELDS = ("_id", "username", "email", "email_verified", "email_verified_at")
+SESSION_FIELDS = ("_id", "user_id", "expires_at")
+ACTIVE_SESSION_FIELDS = ("user_id", "username", "email", "expires_at")
+
+# every function below streams from a server-side cursor fetching batch_size documents per round trip,
+# so memory use does not grow with the collection size; sessions are read from the Session collection only
+# when it is the session store (DJMONGOAUTH_SESSION_STORE), from the configured store otherwise
+
+def export_users(batch_size:int=1000):
+    return _find(User, {}, USER_FIELDS, batch_size)
+
+def export_sessions(active_only:bool=False, batch_size:int=1000):
+    if not _sessions_in_collection():
+        return (_to_row(document, SESSION_FIELDS) for document in _store_sessions(active_only))
+    query = {"expires_at": {"$gt": _now()}} if active_only else {}
+    return _find(Session, query, SESSION_FIELDS, batch_size)
+
+def active_session_users(batch_size:int=1000):
+    # each user holds at most one session, so this is one row per logged-in user with who they are;
+    # the users of every batch of sessions are fetched with a single $in query on _id
+    if _sessions_in_collection():
+        sessions = get_collection(Session).find({"expires_at": {"$gt": _now()}}, {"user_id": 1, "expires_at": 1}, batch_size=batch_size)
+    else:
+        sessions = _store_sessions(active_only=True)
+    while True:
+        batch = list(islice(sessions, batch_size))
+        if not batch:
+            break
+        ids = [ObjectId(document["user_id"]) for document in batch if ObjectId.is_valid(document["user_id"])]
+        users = {str(user["_id"]): user for user in get_collection(User).find({"_id": {"$in": ids}}, {"username": 1, "email": 1})}
+        for document in batch:
+            user = users.get(document["user_id"], {})
+            yield _to_row(dict(document, username=user.get("username"), email=user.get("email")), ACTIVE_SESSION_FIELDS)
+
+def unverified_users(older_than_days:int, batch_size:int=1000):
+    # users carry no creation date; their ObjectId holds it, and ranging over _id uses the _id index
+    created_before = ObjectId.from_datetime(datetime.utcnow() - timedelta(days=older_than_days))
+    query = {"_id": {"$lt": created_before}, "email_verified": False}
+    return _find(User, query, USER_FIELDS + ("created_at",), batch_size)
+
+def summary()->dict:
+    users = get_collection(User)
+    counts = {
+        "users": users.estimated_document_count(),
+        "verified_users": users.count_documents({"email_verified": True})
+    }
+    if _sessions_in_collection():
+        sessions = get_collection(Session)
+        counts["sessions"] = sessions.estimated_document_count()
+        counts["active_sessions"] = sessions.count_documents({"expires_at": {"$gt": _now()}})
+    else:
+        counts["sessions"] = sum(1 for _ in _store_sessions(active_only=False))
+        counts["active_sessions"] = sum(1 for _ in _store_sessions(active_only=True))
+    return counts
+
+def session_store_warning():
+    # the memory store keeps the sessions of the process that created them; a management command is a process
+    # of its own and does not see those of the running server
+    if isinstance(get_session_store(), MemorySessionStore):
+        return "DJMONGOAUTH_SESSION_STORE is the memory store: only sessions created by this process are visible"
+    return None
+
+def write_rows(rows, file, format:str, fields:tuple)->int:
+    # writes rows as they arrive and returns how many were written
+    count = 0
+    if format == "csv":
+        writer = csv.DictWriter(file, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif format == "jsonl":
+        for row in rows:
+            file.write(json.dumps(row))
+            file.write("\n")
+            count += 1
+    else:
+        raise ValueError("Unknown format {}, expected one of {}".format(format, ", ".join(FORMATS)))
+    return count
+
+def write_output(rows, output:str, format:str, fields:tuple)->int:
+    # output is a path, or - for stdout
+    if output == "-":
+        return write_rows(rows, sys.stdout, format, fields)
+    with open(output, "w", newline="", encoding="utf-8") as file:
+        return write_rows(rows, file, format, fields)
+
+def _find(model, query:dict, fields:tuple, batch_size:int):
+    projection = {name: 1 for name in fields if name != "created_at"}
+    cursor = get_collection(model).find(query, projection, batch_size=batch_size)
+    return (_to_row(document, fields) for document in cursor)
+
+def _to_row(document:dict, fields:tuple)->dict:
+    row = {}
+    for name in fields:
+        if name == "created_at":
+            value = document["_id"].generation_time
+        else:
+            value = document.get(name)
+        if isinstance(value, ObjectId):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        row[name] = value
+    return row
+
+def _now():
+    return to_mongo_value(Session, "expires_at", timezone.now())
+
+def _sessions_in_collection()->bool:
+    return isinstance(get_session_store(), MongoSessionStore)
+
+def _store_sessions(active_only:bool):
+    # sessions of the other stores as documents; a store returns them all at once, there is no cursor to stream from
+    expires_after = datetime.now() if active_only else datetime.utcfromtimestamp(0)
+    for session in get_session_store().get_sessions_expiring_after(expires_after):
+        if session.expires_at > expires_after:
+            yield {"_id": None, "user_id": session.user_id, "expires_at": session.expires_at}
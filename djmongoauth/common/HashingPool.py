@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from ..DjMongoAuthUnavailableError import DjMongoAuthUnavailableError
+
+# runs password hashing (PBKDF2 by default) off the request / event loop thread
+# hashlib releases the GIL while hashing, so worker threads hash in parallel across cores
+class HashingPool():
+    def __init__(self, workers:int, max_pending:int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args):
+        # fails fast with DjMongoAuthUnavailableError instead of queueing without bound once max_pending jobs are in flight
+        with self._lock:
+            if self.in_flight >= self.max_pending:
+                self.rejected += 1
+                raise DjMongoAuthUnavailableError("Too many pending password hashing jobs, try again later")
+            self.in_flight += 1
+        try:
+            future = self._get_executor().submit(self._call, func, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def map(self, func, args:list)->list:
+        # blocking batch variant for bulk work outside the event loop; not limited by max_pending
+        return list(self._get_executor().map(lambda arg: self._call(func, arg), args))
+
+    def metrics(self)->dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "queue_depth": self.in_flight - self.active,
+                "active": self.active,
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _call(self, func, *args):
+        with self._lock:
+            self.active += 1
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    def _get_executor(self)->ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="djmongoauth-hash")
+        return self._executor
+
+_workers = getattr(settings, "DJMONGOAUTH_HASHING_WORKERS", os.cpu_count() or 1)
+
+hashing_pool = HashingPool(
+    workers=_workers,
+    max_pending=getattr(settings, "DJMONGOAUTH_HASHING_MAX_PENDING", _workers * 8)
+)
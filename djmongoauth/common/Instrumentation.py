@@ -0,0 +1,177 @@
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# an operation (login, logout, ...) is reported once it finishes, together with the time spent
+# in each phase ("db", "hash", "smtp") and the number of database queries it issued
+
+class OperationRecord():
+    def __init__(self, name:str):
+        self.name = name
+        self.duration = 0.0
+        self.queries = 0
+        self.phases = {}    # phase -> seconds
+        self.failed = False
+
+    def add_phase(self, phase:str, seconds:float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+class LoggingSink():
+    def __init__(self):
+        self.logger = logging.getLogger("djmongoauth.instrumentation")
+
+    def emit(self, record:OperationRecord):
+        self.logger.info("%s took %.2fms (%s) with %d queries%s",
+            record.name,
+            record.duration * 1000,
+            ", ".join("{}={:.2f}ms".format(phase, seconds * 1000) for phase, seconds in record.phases.items()),
+            record.queries,
+            " [failed]" if record.failed else ""
+        )
+
+class PrometheusSink():
+    # aggregates records into counters rendered in the Prometheus text exposition format
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}    # (operation, failed) -> [count, seconds, queries]
+        self._phases = {}        # (operation, phase) -> seconds
+
+    def emit(self, record:OperationRecord):
+        with self._lock:
+            totals = self._operations.setdefault((record.name, record.failed), [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += record.duration
+            totals[2] += record.queries
+            for phase, seconds in record.phases.items():
+                self._phases[(record.name, phase)] = self._phases.get((record.name, phase), 0.0) + seconds
+
+    def render(self)->str:
+        lines = [
+            "# TYPE djmongoauth_operations_total counter",
+            "# TYPE djmongoauth_operation_seconds_total counter",
+            "# TYPE djmongoauth_queries_total counter",
+            "# TYPE djmongoauth_phase_seconds_total counter"
+        ]
+        with self._lock:
+            for (name, failed), (count, seconds, queries) in sorted(self._operations.items()):
+                labels = '{{operation="{}",failed="{}"}}'.format(name, str(failed).lower())
+                lines.append("djmongoauth_operations_total{} {}".format(labels, count))
+                lines.append("djmongoauth_operation_seconds_total{} {:.6f}".format(labels, seconds))
+                lines.append("djmongoauth_queries_total{} {}".format(labels, queries))
+            for (name, phase), seconds in sorted(self._phases.items()):
+                lines.append('djmongoauth_phase_seconds_total{{operation="{}",phase="{}"}} {:.6f}'.format(name, phase, seconds))
+        return "\n".join(lines) + "\n"
+
+class CollectorSink():
+    # keeps every record in memory, meant for tests
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record:OperationRecord):
+        self.records.append(record)
+
+    def clear(self):
+        self.records = []
+
+class _QueryTimer():
+    def __init__(self, record:OperationRecord):
+        self.record = record
+
+    def __call__(self, execute, sql, params, many, context):
+        # covers djongo's SQL to MongoDB translation and the round trip itself
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record.queries += 1
+            self.record.add_phase("db", time.perf_counter() - start)
+
+class Instrumentation():
+    def __init__(self, sinks:list):
+        self.sinks = sinks
+        self._local = threading.local()
+
+    @property
+    def enabled(self)->bool:
+        return bool(self.sinks)
+
+    def get_sink(self, sink_class):
+        for sink in self.sinks:
+            if isinstance(sink, sink_class):
+                return sink
+        return None
+
+    @contextmanager
+    def operation(self, name:str):
+        # nested operations (e.g. login inside a decorated view) are folded into the outermost one
+        if not self.sinks or getattr(self._local, "record", None) is not None:
+            yield
+            return
+        record = OperationRecord(name)
+        self._local.record = record
+        start = time.perf_counter()
+        try:
+            with connections["default"].execute_wrapper(_QueryTimer(record)):
+                yield
+        except BaseException:
+            record.failed = True
+            raise
+        finally:
+            record.duration = time.perf_counter() - start
+            self._local.record = None
+            for sink in self.sinks:
+                try:
+                    sink.emit(record)
+                except Exception:
+                    logger.exception("Instrumentation sink %r failed", sink)
+
+    @contextmanager
+    def phase(self, name:str):
+        record = getattr(self._local, "record", None) if self.sinks else None
+        if record is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record.add_phase(name, time.perf_counter() - start)
+
+    def query(self, func):
+        # decorator for data access that bypasses the ORM (and so execute_wrapper), counted as one query
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            record = getattr(self._local, "record", None) if self.sinks else None
+            if record is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record.queries += 1
+                record.add_phase("db", time.perf_counter() - start)
+        return wrapper
+
+    def instrument(self, name:str):
+        # decorator form of operation()
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.sinks:
+                    return func(*args, **kwargs)
+                with self.operation(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+instrumentation = Instrumentation([
+    import_string(path)() for path in getattr(settings, "DJMONGOAUTH_INSTRUMENTATION_SINKS", [])
+])
@@ -0,0 +1,226 @@
+import atexit
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+USER = "user"
+ALL = "all"
+# values per message; keeps a revocation of many users within one datagram
+CHUNK_SIZE = 1000
+# seconds before connecting again to a transport that failed to start
+RETRY_INTERVAL = 30
+
+# tells every worker process (and, with a broker, every node) to evict cached sessions when a session is
+# logged out, a password is reset or sessions are revoked; subscribers of the publishing process are called
+# before publish returns, the other processes get the message through DJMONGOAUTH_INVALIDATION_TRANSPORT
+class InvalidationBus():
+    def __init__(self, transport_path:str):
+        self.transport_path = transport_path
+        self.transport = None
+        self.origin = None
+        self._pid = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._retry_at = 0
+        self._fork_hook = False
+        self._counts = {"published": 0, "received": 0, "failed": 0, "start_failed": 0}
+
+    def subscribe(self, callback):
+        # callback(kind, values): USER with the epoch second sessions issued before are revoked followed by user
+        # ids, ALL with that epoch second alone, or a kind passed to publish(); the second is the publisher's clock
+        self._subscribers.append(callback)
+
+    def start(self):
+        # connects this process to the transport, once per process; a forked worker connects again
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.origin = uuid.uuid4().hex
+            self.transport = import_string(self.transport_path)()
+            self.transport.start(self._receive)
+            self._pid = os.getpid()
+            if not self._fork_hook:
+                os.register_at_fork(after_in_child=self._after_fork)
+                self._fork_hook = True
+
+    @property
+    def started(self)->bool:
+        return self._pid == os.getpid()
+
+    def ensure_started(self)->bool:
+        # start() for callers that must not fail, like a session lookup: a transport that cannot be reached
+        # is logged, counted and tried again after RETRY_INTERVAL seconds; returns whether this process listens
+        if self.started:
+            return True
+        if time.monotonic() < self._retry_at:
+            return False
+        try:
+            self.start()
+            return True
+        except Exception as e:
+            self._retry_at = time.monotonic() + RETRY_INTERVAL
+            self._counts["start_failed"] += 1
+            logger.warning("djmongoauth invalidation transport not started: %s", e)
+            return False
+
+    def _after_fork(self):
+        # a worker forked from a listening process listens from the start, not from its first lookup, so that
+        # no message published in between is missed; the lock may have been held by another thread of the parent
+        self._lock = threading.Lock()
+        self.ensure_started()
+
+    def publish(self, kind:str, values):
+        # for subscribers with message kinds of their own, like the revocation list
+        self._publish(kind, list(values))
+
+    def publish_users(self, user_ids, issued_before:int=None):
+        self._publish(USER, list(user_ids), [self._issued_before(issued_before)])
+
+    def publish_all(self, issued_before:int=None):
+        self._publish(ALL, [], [self._issued_before(issued_before)])
+
+    def metrics(self)->dict:
+        return dict(self._counts)
+
+    @staticmethod
+    def _issued_before(issued_before:int)->str:
+        # stamped by the publisher: a receiver's own clock, read when the message arrives, would also cover
+        # sessions issued after the revocation
+        return str(int(time.time()) if issued_before is None else issued_before)
+
+    def _publish(self, kind:str, values:list, header:list=None):
+        # header: leads the values of every chunk
+        if not values and kind != ALL:
+            return
+        header = header or []
+        self._deliver(kind, header + values)
+        # a failed publish leaves other processes with stale entries until their cache TTL; it must not fail
+        # the logout or password reset that triggered it
+        try:
+            self.start()
+            for start in range(0, max(len(values), 1), CHUNK_SIZE):
+                self.transport.publish("\n".join([self.origin, kind] + header + values[start:start + CHUNK_SIZE]).encode())
+                self._counts["published"] += 1
+        except Exception as e:
+            self._counts["failed"] += 1
+            logger.warning("djmongoauth invalidation not published: %s", e)
+
+    def _receive(self, payload:bytes):
+        origin, kind, *values = payload.decode().split("\n")
+        if origin == self.origin:
+            return
+        self._counts["received"] += 1
+        self._deliver(kind, values)
+
+    def _deliver(self, kind:str, values:list):
+        for callback in self._subscribers:
+            callback(kind, values)
+
+class LocalTransport():
+    # default: invalidations stay within the publishing process
+    def start(self, receive):
+        pass
+
+    def publish(self, payload:bytes):
+        pass
+
+class UnixSocketTransport():
+    # worker processes of one host, without a broker: every process binds a datagram socket in
+    # DJMONGOAUTH_INVALIDATION_SOCKET_DIR and a publisher sends to every other socket in it
+    def __init__(self):
+        self.directory = getattr(
+            settings,
+            "DJMONGOAUTH_INVALIDATION_SOCKET_DIR",
+            os.path.join(tempfile.gettempdir(), "djmongoauth-invalidation")
+        )
+        self.timeout = getattr(settings, "DJMONGOAUTH_INVALIDATION_TIMEOUT", 1.0)
+        self.path = None
+        self._socket = None
+
+    def start(self, receive):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.path = os.path.join(self.directory, "{}.sock".format(os.getpid()))
+        if os.path.exists(self.path):
+            # left behind by an earlier process with the same pid
+            os.unlink(self.path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.path)
+        self._socket.settimeout(self.timeout)
+        atexit.register(self._unlink, self.path, os.getpid())
+        threading.Thread(target=self._listen, args=(self._socket, receive), daemon=True).start()
+
+    def publish(self, payload:bytes):
+        failed = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith(".sock"):
+                continue
+            try:
+                self._socket.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # nobody listens there any more
+                self._unlink(path, os.getpid())
+            except OSError as e:
+                failed.append("{}: {}".format(name, e))
+        if failed:
+            raise OSError("not delivered to {}".format(", ".join(failed)))
+
+    def _listen(self, sock, receive):
+        while True:
+            try:
+                payload = sock.recv(65536 * 4)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            try:
+                receive(payload)
+            except Exception as e:
+                logger.warning("djmongoauth invalidation not applied: %s", e)
+
+    @staticmethod
+    def _unlink(path:str, pid:int):
+        # a forked child must not remove its parent's socket at exit
+        if pid != os.getpid():
+            return
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+class RedisTransport():
+    # every process of every node, through Redis pub/sub (pip install redis); the client factory is
+    # DJMONGOAUTH_INVALIDATION_REDIS_CLIENT, called with DJMONGOAUTH_INVALIDATION_REDIS_URL
+    CHANNEL = "djmongoauth:invalidation"
+
+    def __init__(self):
+        self.client = import_string(getattr(
+            settings,
+            "DJMONGOAUTH_INVALIDATION_REDIS_CLIENT",
+            "redis.from_url"
+        ))(getattr(settings, "DJMONGOAUTH_INVALIDATION_REDIS_URL", "redis://localhost:6379/0"))
+
+    def start(self, receive):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.CHANNEL: lambda message: receive(message["data"])})
+        pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def publish(self, payload:bytes):
+        self.client.publish(self.CHANNEL, payload)
+
+invalidation_bus = InvalidationBus(getattr(
+    settings,
+    "DJMONGOAUTH_INVALIDATION_TRANSPORT",
+    "djmongoauth.common.InvalidationBus.LocalTransport"
+))
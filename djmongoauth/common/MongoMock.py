@@ -0,0 +1,54 @@
+import threading
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+# mongomock applies a write in several steps (find, then modify); one lock per process keeps each write
+# atomic, as on a server, so concurrent logins and email requests behave as they would against MongoDB
+_write_lock = threading.RLock()
+_WRITES = ("_insert", "_update", "_delete", "_find_and_modify")
+
+def use_mongomock(migrate:bool=True):
+    # points djongo, and everything that gets its collections through it, at an in-memory mongomock database
+    # for this process; requires mongomock (pip install djmongoauth[test])
+    import mongomock
+    import djongo.database
+
+    class MongomockClient(mongomock.MongoClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__()
+
+    for name in _WRITES:
+        write = getattr(mongomock.collection.Collection, name)
+        if not getattr(write, "serialized", False):
+            setattr(mongomock.collection.Collection, name, _serialized(write))
+    djongo.database.MongoClient = MongomockClient
+    djongo.database.clients.clear()
+    connections["default"].close()
+    if migrate:
+        create_collections()
+
+def create_collections():
+    # djmongoauth ships no migrations; its collections are created from the models
+    with override_settings(MIGRATION_MODULES={"djmongoauth": None}):
+        call_command("migrate", "djmongoauth", run_syncdb=True, verbosity=0)
+
+class MongoMockTestRunner(DiscoverRunner):
+    # TEST_RUNNER that creates djmongoauth's collections in the test database, which is a mongomock database
+    # unless DJMONGOAUTH_TEST_MONGOMOCK = False
+    def setup_databases(self, **kwargs):
+        if getattr(settings, "DJMONGOAUTH_TEST_MONGOMOCK", True):
+            use_mongomock(migrate=False)
+        old_config = super().setup_databases(**kwargs)
+        create_collections()
+        return old_config
+
+def _serialized(write):
+    def serialized(*args, **kwargs):
+        with _write_lock:
+            return write(*args, **kwargs)
+    serialized.serialized = True
+    return serialized
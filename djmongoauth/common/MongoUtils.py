@@ -0,0 +1,80 @@
+from django.db import connections, router
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+# IndexOptionsConflict / IndexKeySpecsConflict: an equivalent index already exists under another name
+INDEX_CONFLICT_CODES = (85, 86)
+
+def get_collection(model):
+    connection = connections[router.db_for_write(model)]
+    connection.ensure_connection()
+    return connection.connection[model._meta.db_table]
+
+def get_index_specs(model)->list:
+    specs = []
+    for field in model._meta.fields:
+        if field.unique and not field.primary_key:
+            specs.append(([(field.column, ASCENDING)], {"unique": True}))
+    for index in model._meta.indexes:
+        keys = [
+            (f[1:], DESCENDING) if f.startswith("-") else (f, ASCENDING)
+            for f in index.fields
+        ]
+        specs.append((keys, {"name": index.name}))
+    return specs
+
+def ensure_indexes(models)->list:
+    # returns (collection name, index name, created) for every declared index
+    results = []
+    for model in models:
+        collection = get_collection(model)
+        for keys, options in get_index_specs(model):
+            try:
+                name = collection.create_index(keys, background=True, **options)
+                results.append((collection.name, name, True))
+            except OperationFailure as e:
+                if e.code not in INDEX_CONFLICT_CODES:
+                    raise
+                results.append((collection.name, options.get("name") or keys[0][0], False))
+    return results
+
+def ensure_ttl_indexes(models, field:str="expires_at")->list:
+    # documents are removed by mongod once `field` is in the past
+    results = []
+    for model in models:
+        collection = get_collection(model)
+        name = collection.create_index([(field, ASCENDING)], expireAfterSeconds=0, name="{}_ttl".format(field))
+        results.append((collection.name, name))
+    return results
+
+def to_mongo_value(model, field_name:str, value):
+    # the value djongo would have written for this field
+    field = model._meta.get_field(field_name)
+    return field.get_db_prep_save(value, connections[router.db_for_write(model)])
+
+def to_document(instance)->dict:
+    document = {}
+    for field in instance._meta.concrete_fields:
+        value = getattr(instance, field.attname)
+        if field.primary_key:
+            if value is not None:
+                document[field.column] = value
+            continue
+        document[field.column] = to_mongo_value(type(instance), field.name, value)
+    return document
+
+def from_document(model, document:dict):
+    # builds a model instance like the ORM would; fields missing from a projected document are deferred
+    alias = router.db_for_read(model)
+    connection = connections[alias]
+    names = []
+    values = []
+    for field in model._meta.concrete_fields:
+        if field.column not in document:
+            continue
+        value = document[field.column]
+        if field.get_internal_type() == "DateTimeField":
+            value = connection.ops.convert_datetimefield_value(value, None, connection)
+        names.append(field.attname)
+        values.append(value)
+    return model.from_db(alias, names, values)
@@ -0,0 +1,118 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from ..DjMongoAuthError import DjMongoAuthError
+
+# sliding window counters are approximated from two fixed windows: the current one and the one before it
+# a store only has to keep (window index, previous count, current count) per key
+
+class LocalRateLimitStore():
+    # in-process store, counters are dropped once they are two windows old
+    PRUNE_EVERY = 1024
+
+    def __init__(self):
+        self._counters = {}    # key -> [window index, previous count, current count]
+        self._lock = threading.Lock()
+        self._ops = 0
+
+    def get(self, key:str, window_index:int)->tuple:
+        with self._lock:
+            return self._roll(self._counters.get(key), window_index)
+
+    def incr(self, key:str, window_index:int, window:int):
+        with self._lock:
+            previous, current = self._roll(self._counters.get(key), window_index)
+            self._counters[key] = [window_index, previous, current + 1]
+            self._ops += 1
+            if self._ops % self.PRUNE_EVERY == 0:
+                self._prune(window_index)
+
+    def clear(self, key:str, window_index:int):
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def _roll(self, counter, window_index:int)->tuple:
+        if counter is None or counter[0] < window_index - 1:
+            return 0, 0
+        if counter[0] == window_index - 1:
+            return counter[2], 0
+        return counter[1], counter[2]
+
+    def _prune(self, window_index:int):
+        for key in [k for k, c in self._counters.items() if c[0] < window_index - 1]:
+            del self._counters[key]
+
+class CacheRateLimitStore():
+    # shared store on top of a Django cache (memcached / redis) so limits hold across workers
+    KEY_PREFIX = "djmongoauth:rl:"
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, "DJMONGOAUTH_LOGIN_THROTTLE_CACHE", "default")]
+
+    def get(self, key:str, window_index:int)->tuple:
+        keys = [self._key(key, window_index - 1), self._key(key, window_index)]
+        counts = self.cache.get_many(keys)
+        return counts.get(keys[0], 0), counts.get(keys[1], 0)
+
+    def incr(self, key:str, window_index:int, window:int):
+        cache_key = self._key(key, window_index)
+        if not self.cache.add(cache_key, 1, window * 2):
+            try:
+                self.cache.incr(cache_key)
+            except ValueError:
+                # expired between add() and incr()
+                self.cache.set(cache_key, 1, window * 2)
+
+    def clear(self, key:str, window_index:int):
+        self.cache.delete_many([self._key(key, i) for i in (window_index - 1, window_index)])
+
+    def _key(self, key:str, window_index:int)->str:
+        # hashed so arbitrary usernames are valid memcached keys
+        return "{}{}:{}".format(self.KEY_PREFIX, hashlib.sha256(key.encode()).hexdigest(), window_index)
+
+class LoginThrottle():
+    def __init__(self, store, max_attempts:int, max_attempts_per_ip:int, window:int):
+        self.store = store
+        self.max_attempts = max_attempts
+        self.max_attempts_per_ip = max_attempts_per_ip
+        self.window = window
+
+    def check(self, username:str, client_ip:str=None):
+        # called before any DB or hashing work
+        now = time.time()
+        if self._exceeded("user:" + username, self.max_attempts, now) or \
+                (client_ip and self._exceeded("ip:" + client_ip, self.max_attempts_per_ip, now)):
+            raise DjMongoAuthError("Too many failed login attempts, please try again later")
+
+    def record_failure(self, username:str, client_ip:str=None):
+        window_index = self._window_index(time.time())
+        if self.max_attempts > 0:
+            self.store.incr("user:" + username, window_index, self.window)
+        if client_ip and self.max_attempts_per_ip > 0:
+            self.store.incr("ip:" + client_ip, window_index, self.window)
+
+    def record_success(self, username:str):
+        if self.max_attempts > 0:
+            self.store.clear("user:" + username, self._window_index(time.time()))
+
+    def _exceeded(self, key:str, limit:int, now:float)->bool:
+        if limit <= 0 or self.window <= 0:
+            return False
+        previous, current = self.store.get(key, self._window_index(now))
+        elapsed = (now % self.window) / self.window
+        return previous * (1 - elapsed) + current >= limit
+
+    def _window_index(self, now:float)->int:
+        return int(now // self.window) if self.window > 0 else 0
+
+login_throttle = LoginThrottle(
+    store=import_string(getattr(settings, "DJMONGOAUTH_LOGIN_THROTTLE_STORE", "djmongoauth.common.RateLimiter.LocalRateLimitStore"))(),
+    max_attempts=getattr(settings, "DJMONGOAUTH_LOGIN_MAX_ATTEMPTS", 10),
+    max_attempts_per_ip=getattr(settings, "DJMONGOAUTH_LOGIN_MAX_ATTEMPTS_PER_IP", 100),
+    window=getattr(settings, "DJMONGOAUTH_LOGIN_THROTTLE_WINDOW", 300)
+)
@@ -0,0 +1,53 @@
+import time
+
+from django.utils import timezone
+
+from .MongoUtils import get_collection
+
+class ReapResult():
+    def __init__(self, collection:str, deleted:int, batches:int, elapsed:float):
+        self.collection = collection
+        self.deleted = deleted
+        self.batches = batches
+        self.elapsed = elapsed
+
+def reap_expired(models, batch_size:int=1000)->list:
+    # deletes documents whose expires_at has passed, batch_size documents per round trip
+    results = []
+    for model in models:
+        collection = get_collection(model)
+        expired = {"expires_at": {"$lt": timezone.now()}}
+        deleted = 0
+        batches = 0
+        start = time.perf_counter()
+        while True:
+            ids = [doc["_id"] for doc in collection.find(expired, {"_id": 1}).limit(batch_size)]
+            if not ids:
+                break
+            deleted += collection.delete_many({"_id": {"$in": ids}}).deleted_count
+            batches += 1
+        results.append(ReapResult(collection.name, deleted, batches, time.perf_counter() - start))
+    return results
+
+def dedupe_sessions(session_model, batch_size:int=1000)->ReapResult:
+    # keeps only the latest session of every user, which the unique user_id index requires
+    collection = get_collection(session_model)
+    start = time.perf_counter()
+    deleted = 0
+    batches = 0
+    duplicates = collection.aggregate([
+        {"$sort": {"expires_at": -1}},
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    ids = []
+    for group in duplicates:
+        ids.extend(group["ids"][1:])
+        while len(ids) >= batch_size:
+            deleted += collection.delete_many({"_id": {"$in": ids[:batch_size]}}).deleted_count
+            ids = ids[batch_size:]
+            batches += 1
+    if ids:
+        deleted += collection.delete_many({"_id": {"$in": ids}}).deleted_count
+        batches += 1
+    return ReapResult(collection.name, deleted, batches, time.perf_counter() - start)
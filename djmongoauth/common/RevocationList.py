@@ -0,0 +1,108 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache.backends.locmem import LocMemCache
+
+from .InvalidationBus import invalidation_bus, USER, ALL, LocalTransport
+from .TokenUtils import SIGNED_TOKENS
+
+# revoked session keys, kept until the revoked token would have expired anyway, plus "issued before"
+# watermarks (global and per user) that revoke any number of tokens with a single cache write
+# point DJMONGOAUTH_REVOCATION_CACHE at a shared cache (memcached / redis) when running more than one worker;
+# a process-local cache only learns of other processes' revocations through the invalidation bus
+class RevocationList():
+    KEY_PREFIX = "djmongoauth:revoked:"
+    WATERMARK_KEY = "djmongoauth:revoked-before"
+    USER_WATERMARK_PREFIX = "djmongoauth:revoked-before:"
+    # invalidation message with the "key_digest:exp" of sessions revoked by another process
+    REVOKED = "revoked"
+
+    def __init__(self, cache_alias:str):
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def is_local(self)->bool:
+        return isinstance(self.cache, LocMemCache)
+
+    def revoke(self, sessions, publish:bool=True):
+        # sessions: iterable of (key_digest, exp), key_digest being TokenUtils.session_key_digest() of the session key
+        now = time.time()
+        entries = {}
+        revoked = []
+        timeout = 0
+        for key_digest, exp in sessions:
+            if exp > now:
+                entries[self._key(key_digest)] = True
+                revoked.append("{}:{}".format(key_digest, int(exp)))
+                timeout = max(timeout, int(exp - now))
+        if entries:
+            self.cache.set_many(entries, timeout)
+            if publish and self.is_local:
+                invalidation_bus.publish(self.REVOKED, revoked)
+
+    def revoke_issued_before(self, timestamp:int, lifetime:int, user_ids=None):
+        # revokes tokens issued before timestamp, for the given users or for everyone
+        # a watermark is dropped once every token it covers has expired, i.e. after one session lifetime; it never
+        # moves back, e.g. when this process hears of its own revocation on the invalidation bus a second later
+        if user_ids is None:
+            timestamp = max(timestamp, self.cache.get(self.WATERMARK_KEY, 0))
+            self.cache.set(self.WATERMARK_KEY, timestamp, lifetime)
+        else:
+            keys = [self.USER_WATERMARK_PREFIX + user_id for user_id in user_ids]
+            current = self.cache.get_many(keys)
+            self.cache.set_many({key: max(timestamp, current.get(key, 0)) for key in keys}, lifetime)
+
+    def is_revoked(self, key_digest:str, user_id:str=None, issued_at:int=None)->bool:
+        # a single cache round trip for the session key and both watermarks
+        if self.is_local:
+            invalidation_bus.ensure_started()
+        key = self._key(key_digest)
+        if issued_at is None:
+            return self.cache.get(key, False)
+        watermark_keys = [self.WATERMARK_KEY, self.USER_WATERMARK_PREFIX + user_id]
+        values = self.cache.get_many([key] + watermark_keys)
+        if values.get(key, False):
+            return True
+        return any(issued_at < values[k] for k in watermark_keys if k in values)
+
+    def on_invalidation(self, kind:str, values:list):
+        # revocations published by other processes: the exact sessions revoked by logout and password reset, and
+        # watermarks for every invalidated user or for everyone, at the second the publisher revoked them
+        if not self.is_local:
+            return
+        if kind == self.REVOKED:
+            sessions = (value.split(":") for value in values)
+            self.revoke(((key_digest, int(exp)) for key_digest, exp in sessions), publish=False)
+        elif kind == USER:
+            self.revoke_issued_before(int(values[0]), self._lifetime(), user_ids=values[1:])
+        elif kind == ALL:
+            self.revoke_issued_before(int(values[0]), self._lifetime())
+
+    def _lifetime(self)->int:
+        from ..models import Session
+        return int(Session.get_lifetime().total_seconds())
+
+    def _key(self, key_digest:str)->str:
+        return self.KEY_PREFIX + key_digest
+
+revocation_list = RevocationList(getattr(settings, "DJMONGOAUTH_REVOCATION_CACHE", "default"))
+invalidation_bus.subscribe(revocation_list.on_invalidation)
+
+def check_revocation_list():
+    # called at startup: signed tokens are only checked against the revocation list, so with a per-process
+    # cache and no transport a token logged out in one worker stays valid in the others until it expires
+    if not SIGNED_TOKENS or not revocation_list.is_local:
+        return
+    if invalidation_bus.transport_path == "{}.{}".format(LocalTransport.__module__, LocalTransport.__name__):
+        raise ImproperlyConfigured(
+            "DJMONGOAUTH_SIGNED_TOKENS needs DJMONGOAUTH_REVOCATION_CACHE to be a shared cache "
+            "(memcached, redis) or DJMONGOAUTH_INVALIDATION_TRANSPORT to reach every worker"
+        )
+    # listen before the first request, so that no revocation published meanwhile is missed
+    invalidation_bus.ensure_started()
@@ -0,0 +1,113 @@
+import logging
+import queue
+from smtplib import SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from .Email import Email
+from .EmailUtils import to_message
+
+logger = logging.getLogger(__name__)
+
+# the connection is gone, not the message at fault: reconnect and send the rest of the batch
+CONNECTION_ERRORS = (SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+class SendResult():
+    def __init__(self):
+        self.sent = 0
+        # (email, exception) for every email that was not sent
+        self.failed = []
+
+# keeps up to `size` open mail backend connections and sends batches of emails over each of them,
+# so bulk sends pay one SMTP / TLS handshake per connection rather than per message
+class SMTPConnectionPool():
+    def __init__(self, size:int, batch_size:int):
+        self.size = size
+        self.batch_size = batch_size
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def send_email(self, email:Email):
+        result = self.send_emails([email])
+        if result.failed:
+            raise result.failed[0][1]
+
+    def send_emails(self, emails)->SendResult:
+        # an email the server rejects is reported in the result and does not stop the others
+        emails = list(emails)
+        result = SendResult()
+        for i in range(0, len(emails), self.batch_size):
+            try:
+                self._send_batch(emails[i:i + self.batch_size], result)
+            except Exception as e:
+                # no connection to the mail server: the later batches cannot be sent either
+                logger.warning("Mail server unreachable: %s", e)
+                result.failed.extend((email, e) for email in emails[i + self.batch_size:])
+                break
+        return result
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            connection.close()
+
+    def _send_batch(self, emails:list, result:SendResult):
+        # one message at a time over the connection, so a failure is known to concern exactly that message;
+        # each message is sent at most once more after a dropped connection (e.g. an idle one the server closed)
+        index = 0
+        retried = None
+        try:
+            connection = self._acquire()
+        except Exception as e:
+            result.failed.extend((email, e) for email in emails)
+            raise
+        while index < len(emails):
+            try:
+                result.sent += connection.send_messages([to_message(emails[index])]) or 0
+            except CONNECTION_ERRORS as e:
+                self._discard(connection)
+                try:
+                    if retried == index:
+                        raise
+                    logger.warning("Pooled mail connection failed (%s), reconnecting", e)
+                    retried = index
+                    connection = self._acquire(fresh=True)
+                except Exception as error:
+                    result.failed.extend((email, error) for email in emails[index:])
+                    raise
+                continue
+            except Exception as e:
+                logger.warning("Email to %s not sent: %s", emails[index].to_email, e)
+                result.failed.append((emails[index], e))
+            index += 1
+        self._release(connection)
+
+    def _acquire(self, fresh:bool=False):
+        if not fresh:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        return connection
+
+    def _release(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+smtp_pool = SMTPConnectionPool(
+    size=getattr(settings, "DJMONGOAUTH_SMTP_POOL_SIZE", 4),
+    batch_size=getattr(settings, "DJMONGOAUTH_SMTP_BATCH_SIZE", 100)
+)
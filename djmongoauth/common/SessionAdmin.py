@@ -0,0 +1,64 @@
+import calendar
+import time
+from datetime import datetime
+
+from ..models import Session
+from ..sessions import get_session_store
+from .RevocationList import revocation_list
+from .InvalidationBus import invalidation_bus
+from .TokenUtils import SIGNED_TOKENS
+
+# revokes sessions in bulk: one delete in the session store, one watermark in the revocation list for signed tokens
+# (plus an entry per session issued within the watermark's second) and one invalidation message
+class RevocationResult():
+    def __init__(self, scope:str, deleted:int, elapsed:float):
+        self.scope = scope
+        self.deleted = deleted
+        self.elapsed = elapsed
+
+def revoke_sessions_issued_before(timestamp:datetime)->RevocationResult:
+    # timestamp is naive UTC, like Session.expires_at; sessions store no issue time, a session
+    # issued before timestamp is one expiring before timestamp + the session lifetime
+    start = time.perf_counter()
+    if SIGNED_TOKENS:
+        revocation_list.revoke_issued_before(_to_epoch(timestamp), _lifetime())
+        if timestamp.microsecond:
+            before = _to_epoch(timestamp) + timestamp.microsecond / 1e6
+            Session.revoke(s for s in _issued_since(_to_epoch(timestamp)) if s.get_exp() - _lifetime() < before)
+    deleted = get_session_store().delete_sessions_expiring_before(timestamp + Session.get_lifetime())
+    # cached entries do not record when their session was issued
+    invalidation_bus.publish_all(issued_before=_to_epoch(timestamp))
+    return RevocationResult("issued before {}".format(timestamp.isoformat()), deleted, time.perf_counter() - start)
+
+def revoke_user_sessions(user_ids)->RevocationResult:
+    start = time.perf_counter()
+    user_ids = list(user_ids)
+    watermark = _to_epoch(datetime.now())
+    if SIGNED_TOKENS:
+        revocation_list.revoke_issued_before(watermark, _lifetime(), user_ids=user_ids)
+        Session.revoke(_issued_since(watermark, user_ids))
+    deleted = get_session_store().delete_sessions_of_users(user_ids)
+    invalidation_bus.publish_users(user_ids, issued_before=watermark)
+    return RevocationResult("{} users".format(len(user_ids)), deleted, time.perf_counter() - start)
+
+def revoke_all_sessions()->RevocationResult:
+    # e.g. after rotating SECRET_KEY or a suspected token leak
+    start = time.perf_counter()
+    watermark = _to_epoch(datetime.now())
+    if SIGNED_TOKENS:
+        revocation_list.revoke_issued_before(watermark, _lifetime())
+        Session.revoke(_issued_since(watermark))
+    deleted = get_session_store().delete_all_sessions()
+    invalidation_bus.publish_all(issued_before=watermark)
+    return RevocationResult("all sessions", deleted, time.perf_counter() - start)
+
+def _to_epoch(timestamp:datetime)->int:
+    # whole seconds, like token exp
+    return calendar.timegm(timestamp.utctimetuple())
+
+def _issued_since(watermark:int, user_ids:list=None)->list:
+    # a watermark only covers tokens issued before its second; the sessions issued since are revoked one by one
+    return get_session_store().get_sessions_expiring_after(datetime.utcfromtimestamp(watermark + _lifetime()), user_ids)
+
+def _lifetime()->int:
+    return int(Session.get_lifetime().total_seconds())
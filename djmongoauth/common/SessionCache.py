@@ -0,0 +1,103 @@
+import calendar
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+
+from .InvalidationBus import invalidation_bus, USER, ALL
+
+# bounded in-process LRU of validated sessions, keyed by session_key
+# an entry never outlives the session's own expires_at, and is evicted in every process subscribed
+# to the invalidation bus when its session or user is invalidated
+class SessionCache():
+    def __init__(self, max_size:int, ttl:int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()    # session_key -> (user_id, deadline)
+        self._user_keys = {}             # user_id -> set of session_keys
+        self._generation = 0             # bumped by every invalidation
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self)->bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    @property
+    def generation(self)->int:
+        # read before validating a session; set() drops the entry if an invalidation came in meanwhile
+        return self._generation
+
+    def get(self, session_key:str):
+        # this process caches sessions, so it has to hear about invalidations; while it cannot, nothing is cached
+        if not self.enabled or not invalidation_bus.ensure_started():
+            return None
+        with self._lock:
+            entry = self._entries.get(session_key)
+            if entry is None:
+                return None
+            user_id, deadline = entry
+            if deadline <= time.time():
+                self._remove(session_key)
+                return None
+            self._entries.move_to_end(session_key)
+            return user_id
+
+    def set(self, session_key:str, user_id:str, expires_at:datetime, generation:int=None):
+        if not self.enabled or not invalidation_bus.started:
+            return
+        deadline = min(time.time() + self.ttl, calendar.timegm(expires_at.utctimetuple()))
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._remove(session_key)
+            self._entries[session_key] = (user_id, deadline)
+            self._user_keys.setdefault(user_id, set()).add(session_key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, session_key:str):
+        with self._lock:
+            self._generation += 1
+            self._remove(session_key)
+
+    def invalidate_user(self, user_id:str):
+        with self._lock:
+            self._generation += 1
+            for session_key in self._user_keys.pop(user_id, set()):
+                self._entries.pop(session_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def on_invalidation(self, kind:str, values:list):
+        if kind == USER:
+            for user_id in values[1:]:
+                self.invalidate_user(user_id)
+        elif kind == ALL:
+            self.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, session_key:str):
+        entry = self._entries.pop(session_key, None)
+        if entry is None:
+            return
+        keys = self._user_keys.get(entry[0])
+        if keys is not None:
+            keys.discard(session_key)
+            if not keys:
+                del self._user_keys[entry[0]]
+
+# off unless DJMONGOAUTH_SESSION_CACHE_TTL is set: with the default LocalTransport, other worker processes
+# would keep accepting a logged-out session until its entry expires
+session_cache = SessionCache(
+    max_size=getattr(settings, "DJMONGOAUTH_SESSION_CACHE_SIZE", 1024),
+    ttl=getattr(settings, "DJMONGOAUTH_SESSION_CACHE_TTL", 0)
+)
+invalidation_bus.subscribe(session_cache.on_invalidation)
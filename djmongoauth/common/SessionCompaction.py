@@ -0,0 +1,89 @@
+import time
+
+import bson
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from .MongoUtils import get_collection
+from .TokenUtils import hash_session_key
+
+# sessions still holding their raw session key and x_auth_token
+LEGACY = {"x_auth_token": {"$type": "string"}}
+
+class CompactionResult():
+    def __init__(self, collection:str, compacted:int, batches:int, dropped_indexes:list, elapsed:float):
+        self.collection = collection
+        self.compacted = compacted
+        self.batches = batches
+        self.dropped_indexes = dropped_indexes
+        self.elapsed = elapsed
+
+class StorageStats():
+    def __init__(self, documents:int, data_size:int, index_sizes:dict, estimated:bool):
+        self.documents = documents
+        self.data_size = data_size
+        self.index_sizes = index_sizes
+        # True when the server has no collStats and sizes are BSON sizes of the documents and index keys
+        self.estimated = estimated
+
+    @property
+    def avg_document_size(self)->float:
+        return self.data_size / self.documents if self.documents else 0.0
+
+    @property
+    def index_size(self)->int:
+        return sum(self.index_sizes.values())
+
+def count_legacy_sessions(session_model)->int:
+    return get_collection(session_model).count_documents(LEGACY)
+
+def compact_sessions(session_model, batch_size:int=1000)->CompactionResult:
+    # replaces the session_key of every legacy session by its hash and its x_auth_token by null; tokens
+    # already handed out keep working, since lookups hash the token's session key the same way
+    # the unique index on x_auth_token goes first: it would count the nulls as duplicates
+    collection = get_collection(session_model)
+    start = time.perf_counter()
+    dropped_indexes = drop_x_auth_token_indexes(collection)
+    compacted = 0
+    batches = 0
+    while True:
+        documents = list(collection.find(LEGACY, {"session_key": 1}).limit(batch_size))
+        if not documents:
+            break
+        compacted += collection.bulk_write([
+            # matching LEGACY again leaves alone a session a login replaced since it was read
+            UpdateOne(
+                dict(LEGACY, _id=document["_id"], session_key=document["session_key"]),
+                {"$set": {"session_key": hash_session_key(document["session_key"]), "x_auth_token": None}}
+            )
+            for document in documents
+        ], ordered=False).modified_count
+        batches += 1
+    return CompactionResult(collection.name, compacted, batches, dropped_indexes, time.perf_counter() - start)
+
+def drop_x_auth_token_indexes(collection)->list:
+    dropped = []
+    for name, index in collection.index_information().items():
+        if [field for field, _ in index["key"]] == ["x_auth_token"]:
+            collection.drop_index(name)
+            dropped.append(name)
+    return dropped
+
+def session_storage_stats(session_model)->StorageStats:
+    collection = get_collection(session_model)
+    try:
+        stats = collection.database.command({"collStats": collection.name})
+        return StorageStats(stats["count"], stats["size"], dict(stats["indexSizes"]), False)
+    except (OperationFailure, NotImplementedError, KeyError):
+        pass
+    # every index holds one key per document: its BSON-encoded values
+    indexes = {name: [field for field, _ in index["key"]] for name, index in collection.index_information().items()}
+    documents = 0
+    data_size = 0
+    index_sizes = dict.fromkeys(indexes, 0)
+    for document in collection.find():
+        documents += 1
+        data_size += len(bson.encode(document))
+        for name, fields in indexes.items():
+            index_sizes[name] += len(bson.encode({field: document.get(field) for field in fields}))
+    return StorageStats(documents, data_size, index_sizes, True)
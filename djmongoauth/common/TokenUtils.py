@@ -0,0 +1,44 @@
+import base64
+import hashlib
+import hmac
+
+from django.conf import settings
+
+SIGNED_TOKENS = getattr(settings, "DJMONGOAUTH_SIGNED_TOKENS", False)
+# sessions store a hash of their key and no x_auth_token; both are rebuilt from user_id and expires_at
+COMPACT_SESSIONS = getattr(settings, "DJMONGOAUTH_COMPACT_SESSIONS", False)
+SIGNATURE_FIELD = "sig"
+HASHED_KEY_LENGTH = 43
+
+def _signature(payload:str)->str:
+    key = hashlib.sha256(("djmongoauth.x_auth_token" + settings.SECRET_KEY).encode()).digest()
+    return hmac.new(key, payload.encode(), hashlib.sha256).hexdigest()
+
+def sign_token(payload:str)->str:
+    return "{}&{}={}".format(payload, SIGNATURE_FIELD, _signature(payload))
+
+def has_valid_signature(x_auth_token:str)->bool:
+    payload, sep, signature = x_auth_token.rpartition("&{}=".format(SIGNATURE_FIELD))
+    if not sep:
+        return False
+    return hmac.compare_digest(signature, _signature(payload))
+
+def derive_session_key(user_id:str, expires_at_ms:int)->str:
+    # the key of a compact session; only the server can compute it, and it changes with SECRET_KEY
+    key = hashlib.sha256(("djmongoauth.session_key" + settings.SECRET_KEY).encode()).digest()
+    return _encode(hmac.new(key, "{}:{}".format(user_id, expires_at_ms).encode(), hashlib.sha256).digest())
+
+def hash_session_key(session_key:str)->str:
+    # what compact sessions store in place of the key: 43 characters, whatever the key's length
+    return _encode(hashlib.sha256(session_key.encode()).digest())
+
+def session_key_digest(session_key:str)->str:
+    # hex SHA-256 of a token's session key; revocations are keyed by it whether sessions are compact or not
+    return hashlib.sha256(session_key.encode()).hexdigest()
+
+def hashed_key_digest(hashed_key:str)->str:
+    # session_key_digest() of the key a hash_session_key() value was computed from
+    return base64.urlsafe_b64decode(hashed_key + "=").hex()
+
+def _encode(digest:bytes)->str:
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
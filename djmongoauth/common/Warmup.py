@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.db import connections, router
+
+from ..models import User, Session, TemporaryAuthenticator
+from ..repositories import get_repository
+from ..sessions import get_session_store
+from .EmailFactory import EmailFactory
+from .EmailTypes import EmailTypes
+from .MongoUtils import ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+MODELS = (User, Session, TemporaryAuthenticator)
+
+# moves per-process first-request costs (server selection, TCP / TLS handshakes, authSource authentication,
+# index builds, template and repository loading) to startup
+def warm_up(pool_size:int=0, indexes:bool=False, caches:bool=False)->list:
+    # returns (step, seconds) for every step run
+    timings = []
+    if pool_size > 0:
+        timings.append(("connections", _timed(open_connections, pool_size)))
+    if indexes:
+        timings.append(("indexes", _timed(ensure_indexes, MODELS)))
+    if caches:
+        timings.append(("caches", _timed(warm_caches)))
+    return timings
+
+def open_connections(pool_size:int):
+    # pings from pool_size threads at once, so the driver has to open (and authenticate) that many sockets
+    # and leaves them idle in its pool; keep pool_size within the client's maxPoolSize (100 by default)
+    connection = connections[router.db_for_write(User)]
+    connection.ensure_connection()
+    database = connection.connection
+    barrier = threading.Barrier(pool_size)
+
+    def ping(_):
+        barrier.wait()
+        database.command("ping")
+
+    with ThreadPoolExecutor(max_workers=pool_size) as executor:
+        list(executor.map(ping, range(pool_size)))
+
+def warm_caches():
+    get_repository()
+    get_session_store()
+    get_hashers()
+    for type in EmailTypes:
+        EmailFactory.get_templates(type)
+
+def warm_up_from_settings():
+    # called from AppConfig.ready(); a failed warm-up is logged and never stops the process from starting
+    pool_size = getattr(settings, "DJMONGOAUTH_WARMUP_CONNECTIONS", 0)
+    indexes = getattr(settings, "DJMONGOAUTH_WARMUP_INDEXES", False)
+    caches = getattr(settings, "DJMONGOAUTH_WARMUP_CACHES", False)
+    if not (pool_size or indexes or caches):
+        return
+    try:
+        timings = warm_up(pool_size=pool_size, indexes=indexes, caches=caches)
+    except Exception as e:
+        logger.warning("djmongoauth warm-up failed: %s", e)
+        return
+    logger.info("djmongoauth warm-up: %s", ", ".join("{} {:.3f}s".format(step, elapsed) for step, elapsed in timings))
+
+def _timed(func, *args)->float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
@@ -1,29 +1,75 @@
+import asyncio
 import functools
 from ..models import Session, User
+from ..common.AuthToken import AuthToken
 from ..DjMongoAuthError import DjMongoAuthError
-from bson.objectid import ObjectId
+from ..common.SessionCache import session_cache
+from ..common.TokenUtils import SIGNED_TOKENS
+from ..common.Instrumentation import instrumentation
+from ..repositories import get_repository, get_async_repository
+from ..sessions import get_session_store, get_async_session_store
 
 def authenticated():
     def decorator(func):
+        # Django serves async views from 3.1 on
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper_authenticated(*args, **kwargs):
+                request = args[0]
+                assert request
+                await _aauthenticate(request)
+                return await func(*args, **kwargs)
+            return async_wrapper_authenticated
+
         @functools.wraps(func)
         def wrapper_authenticated(*args, **kwargs):
             # args[0] is django request
             request = args[0]
             assert request
-            try:
-                exp, user_id, username, session_key = Session.parse_x_auth_token(request.META["HTTP_AUTHORIZATION"])
-                user = User.objects.get(_id=ObjectId(user_id))
-                valid_session = False
-                # check session
-                all_sessions = Session.objects.filter(session_key=session_key)
-                for session in all_sessions:
-                    if not session.has_expired():
-                        valid_session = True
-                        break 
-                if not valid_session:
-                    raise DjMongoAuthError("No active session found for user {}".format(username))
-            except Exception as e:
-                raise DjMongoAuthError("User is not authenticated: {}".format(str(e)))
+            _authenticate(request)
             return func(*args, **kwargs) 
         return wrapper_authenticated
-    return decorator
\ No newline at end of file
+    return decorator
+
+@instrumentation.instrument("authenticated")
+def _authenticate(request):
+    try:
+        token = AuthToken.from_request(request)
+        user_id, session_key = token.user_id, token.session_key
+        # signed tokens are verified without touching the database; otherwise a cache hit
+        # means this session was validated recently and has not been invalidated since
+        if SIGNED_TOKENS:
+            Session.verify_signed_x_auth_token(token)
+        elif session_cache.get(session_key) != user_id:
+            generation = session_cache.generation
+            if not get_repository().user_exists(user_id):
+                raise DjMongoAuthError("User not found!")
+            # check session
+            valid_session = get_session_store().get_active_session(user_id=user_id, session_key=Session.lookup_key(session_key))
+            if not valid_session:
+                raise DjMongoAuthError("No active session found for user {}".format(token.username))
+            session_cache.set(session_key, valid_session.user_id, valid_session.expires_at, generation)
+        # no query here; the view pays for the fields it reads. request.user stays django.contrib.auth's
+        request.djmongoauth_user = User.deferred(user_id)
+    except Exception as e:
+        raise DjMongoAuthError("User is not authenticated: {}".format(str(e)))
+
+async def _aauthenticate(request):
+    # same checks as _authenticate(), awaiting the async repository on a session cache miss
+    try:
+        token = AuthToken.from_request(request)
+        user_id, session_key = token.user_id, token.session_key
+        if SIGNED_TOKENS:
+            Session.verify_signed_x_auth_token(token)
+        elif session_cache.get(session_key) != user_id:
+            generation = session_cache.generation
+            if not await get_async_repository().user_exists(user_id):
+                raise DjMongoAuthError("User not found!")
+            valid_session = await get_async_session_store().get_active_session(user_id=user_id, session_key=Session.lookup_key(session_key))
+            if not valid_session:
+                raise DjMongoAuthError("No active session found for user {}".format(token.username))
+            session_cache.set(session_key, valid_session.user_id, valid_session.expires_at, generation)
+        # deferred fields cannot load lazily in async code: await request.djmongoauth_user.arefresh_from_db(fields=[...])
+        request.djmongoauth_user = User.deferred(user_id)
+    except Exception as e:
+        raise DjMongoAuthError("User is not authenticated: {}".format(str(e)))
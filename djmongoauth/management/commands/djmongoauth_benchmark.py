@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...common.MongoMock import use_mongomock
+from ...common.Benchmark import AuthBenchmark, benchmark_token_parsing, benchmark_session_stores
+
+class Command(BaseCommand):
+    help = "Benchmark register / login / authenticated / send_email / handle_email_request / logout"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100, help="Users created and driven through every flow")
+        parser.add_argument("--concurrency", type=int, default=4, help="Worker threads per operation")
+        parser.add_argument("--stress-login", type=int, default=0, metavar="N",
+            help="Instead of the benchmark, log one user in N times concurrently and check they share one session")
+        parser.add_argument("--stress-email-request", type=int, default=0, metavar="N",
+            help="Instead of the benchmark, submit one password reset link N times concurrently and check it works once")
+        parser.add_argument("--token-parsing", type=int, default=0, metavar="N",
+            help="Instead of the benchmark, time N token parses with the old parser and with AuthToken")
+        parser.add_argument("--session-stores", type=int, default=0, metavar="N",
+            help="Instead of the benchmark, time N sessions through each session store backend")
+        parser.add_argument("--in-memory", action="store_true", help="Run against an in-memory mongomock database instead of DATABASES")
+
+    def handle(self, *args, **options):
+        if options["token_parsing"]:
+            for name, ns in benchmark_token_parsing(options["token_parsing"]):
+                self.stdout.write("{:<34}{:>10.0f} ns/call".format(name, ns))
+            return
+        if options["in_memory"]:
+            try:
+                use_mongomock()
+            except ImportError:
+                raise CommandError("--in-memory requires mongomock (pip install djmongoauth[benchmark])")
+        if options["session_stores"]:
+            for store, operation, us in benchmark_session_stores(options["session_stores"]):
+                self.stdout.write("{:<8}{:<26}{:>10.1f} us/call".format(store, operation, us))
+            return
+        benchmark = AuthBenchmark(users=options["users"], concurrency=options["concurrency"])
+        if options["stress_login"]:
+            result = benchmark.stress_login(options["stress_login"])
+            self.stdout.write("{attempts} concurrent logins: {distinct_tokens} distinct token(s), {session_documents} session document(s)".format(**result))
+            if result["distinct_tokens"] != 1 or result["session_documents"] != 1:
+                raise CommandError("Concurrent logins did not converge on a single session")
+            return
+        if options["stress_email_request"]:
+            result = benchmark.stress_email_request(options["stress_email_request"])
+            self.stdout.write("{attempts} concurrent submissions of one reset link: {succeeded} succeeded, {authenticators_left} authenticator(s) left".format(**result))
+            if result["succeeded"] != 1 or not result["password_applied"] or result["authenticators_left"]:
+                raise CommandError("The reset link was not used exactly once")
+            return
+        results = benchmark.run()
+        self.stdout.write("{:<22}{:>8}{:>8}{:>12}{:>10}{:>10}{:>12}".format(
+            "operation", "count", "errors", "ops/s", "p50 ms", "p99 ms", "queries/op"
+        ))
+        for r in results:
+            self.stdout.write("{:<22}{:>8}{:>8}{:>12.1f}{:>10.2f}{:>10.2f}{:>12.2f}".format(
+                r["operation"], r["count"], r["errors"], r["throughput"], r["p50_ms"], r["p99_ms"], r["queries_per_op"]
+            ))
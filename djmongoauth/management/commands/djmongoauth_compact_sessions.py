@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from ...models import Session
+from ...common.SessionCompaction import compact_sessions, count_legacy_sessions, session_storage_stats
+from ...common.TokenUtils import COMPACT_SESSIONS
+
+class Command(BaseCommand):
+    help = "Hash the session keys of stored sessions and clear their x_auth_token (DJMONGOAUTH_COMPACT_SESSIONS)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Sessions updated per round trip")
+        parser.add_argument("--dry-run", action="store_true", help="Only report the sessions to compact and current sizes")
+
+    def handle(self, *args, **options):
+        if not COMPACT_SESSIONS and not options["dry_run"]:
+            # without it, lookups would not hash token session keys and compacted sessions could not be found
+            self.stderr.write("Set DJMONGOAUTH_COMPACT_SESSIONS = True before compacting sessions")
+            return
+        self._write_stats("before", session_storage_stats(Session))
+        if options["dry_run"]:
+            self.stdout.write("{} sessions to compact".format(count_legacy_sessions(Session)))
+            return
+        result = compact_sessions(Session, batch_size=options["batch_size"])
+        for name in result.dropped_indexes:
+            self.stdout.write("{}.{}: dropped".format(result.collection, name))
+        self.stdout.write("{}: compacted {} sessions in {} batches ({:.3f}s)".format(
+            result.collection,
+            result.compacted,
+            result.batches,
+            result.elapsed
+        ))
+        self._write_stats("after", session_storage_stats(Session))
+
+    def _write_stats(self, label:str, stats):
+        self.stdout.write("{}: {} sessions, {} bytes of documents ({:.1f} per session), {} bytes of indexes{}".format(
+            label,
+            stats.documents,
+            stats.data_size,
+            stats.avg_document_size,
+            stats.index_size,
+            " (estimated)" if stats.estimated else ""
+        ))
+        for name, size in sorted(stats.index_sizes.items()):
+            self.stdout.write("  {}: {} bytes".format(name, size))
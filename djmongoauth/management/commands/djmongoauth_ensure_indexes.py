@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import DuplicateKeyError
+
+from ...models import User, Session, TemporaryAuthenticator
+from ...common.MongoUtils import ensure_indexes
+
+class Command(BaseCommand):
+    help = "Create the MongoDB indexes declared by djmongoauth models"
+
+    def handle(self, *args, **options):
+        try:
+            results = ensure_indexes([User, Session, TemporaryAuthenticator])
+        except DuplicateKeyError as e:
+            raise CommandError("{}\nIf a user has more than one session document, run "
+                "'manage.py djmongoauth_reap_expired --dedupe-sessions' first".format(e))
+        for collection, name, created in results:
+            self.stdout.write("{}.{}: {}".format(
+                collection,
+                name,
+                "ok" if created else "already exists under a different name"
+            ))
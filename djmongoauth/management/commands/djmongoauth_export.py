@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from ...common.Export import FORMATS, USER_FIELDS, SESSION_FIELDS, export_users, export_sessions, session_store_warning, write_output
+
+class Command(BaseCommand):
+    help = "Stream users or sessions to JSON lines or CSV (password hashes and session secrets are left out)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("collection", choices=("users", "sessions"))
+        parser.add_argument("--format", choices=FORMATS, default="jsonl")
+        parser.add_argument("--output", default="-", help="Output file, - for stdout")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Documents fetched per round trip")
+        parser.add_argument("--active-only", action="store_true", help="Sessions: only those that have not expired")
+
+    def handle(self, *args, **options):
+        if options["collection"] == "users":
+            rows, fields = export_users(batch_size=options["batch_size"]), USER_FIELDS
+        else:
+            warning = session_store_warning()
+            if warning:
+                self.stderr.write(self.style.WARNING(warning))
+            rows, fields = export_sessions(active_only=options["active_only"], batch_size=options["batch_size"]), SESSION_FIELDS
+        count = write_output(rows, options["output"], options["format"], fields)
+        self.stderr.write("Exported {} {}".format(count, options["collection"]))
@@ -0,0 +1,48 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...common.BulkImport import FORMATS, read_records, import_users
+
+class Command(BaseCommand):
+    help = "Register users in bulk from a CSV or JSON lines file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV (with a username,email,password header) or JSON lines file, - for stdin")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Users hashed and inserted per bulk write")
+        parser.add_argument("--hashed-passwords", action="store_true", help="Passwords are already Django password hashes")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if format not in FORMATS:
+            raise CommandError("Cannot tell the format of {}, pass --format".format(path))
+        file = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            result = import_users(
+                read_records(file, format),
+                batch_size=options["batch_size"],
+                hashed_passwords=options["hashed_passwords"],
+                progress=self._report_progress
+            )
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        for number, username, error in sorted(result.errors, key=lambda error: error[0]):
+            self.stderr.write("record {} ({}): {}".format(number, username, error))
+        self.stdout.write("Imported {} of {} users in {:.1f}s, {} failed".format(
+            result.inserted,
+            result.processed,
+            result.elapsed,
+            len(result.errors)
+        ))
+
+    def _report_progress(self, result):
+        self.stdout.write("{} processed, {} inserted, {} failed ({:.0f} users/s)".format(
+            result.processed,
+            result.inserted,
+            len(result.errors),
+            result.throughput
+        ))
@@ -0,0 +1,48 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from ...models import Session, TemporaryAuthenticator
+from ...common.MongoUtils import ensure_ttl_indexes
+from ...common.Reaper import ReapResult, reap_expired, dedupe_sessions
+from ...sessions import get_session_store
+from ...sessions.MongoSessionStore import MongoSessionStore
+
+class Command(BaseCommand):
+    help = "Delete expired sessions and temporary authenticators"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Documents deleted per round trip")
+        parser.add_argument("--interval", type=int, default=0, help="Keep running and reap every N seconds")
+        parser.add_argument("--ttl-indexes", action="store_true", help="Also create MongoDB TTL indexes on expires_at")
+        parser.add_argument("--dedupe-sessions", action="store_true", help="Also keep only the latest session of every user")
+
+    def handle(self, *args, **options):
+        models = [Session, TemporaryAuthenticator]
+        if options["ttl_indexes"]:
+            for collection, name in ensure_ttl_indexes(models):
+                self.stdout.write("{}.{}: ok".format(collection, name))
+        while True:
+            results = reap_expired(models, batch_size=options["batch_size"])
+            if options["dedupe_sessions"]:
+                results.append(dedupe_sessions(Session, batch_size=options["batch_size"]))
+            session_store = get_session_store()
+            if not isinstance(session_store, MongoSessionStore):
+                results.append(self._reap_session_store(session_store))
+            for result in results:
+                self.stdout.write("{}: removed {} documents in {} batches ({:.3f}s)".format(
+                    result.collection,
+                    result.deleted,
+                    result.batches,
+                    result.elapsed
+                ))
+            if options["interval"] <= 0:
+                break
+            time.sleep(options["interval"])
+
+    def _reap_session_store(self, session_store)->ReapResult:
+        # sessions kept outside MongoDB are purged in one pass
+        start = time.perf_counter()
+        deleted = session_store.delete_sessions_expiring_before(datetime.now())
+        return ReapResult(type(session_store).__name__, deleted, 1, time.perf_counter() - start)
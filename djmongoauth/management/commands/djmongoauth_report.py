@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from ...common.Export import FORMATS, USER_FIELDS, ACTIVE_SESSION_FIELDS, active_session_users, unverified_users, summary, session_store_warning, write_output
+
+class Command(BaseCommand):
+    help = "Reports computed in MongoDB: summary counts, users with an active session, unverified users"
+
+    def add_arguments(self, parser):
+        parser.add_argument("report", choices=("summary", "active-sessions", "unverified-users"))
+        parser.add_argument("--older-than-days", type=int, default=0, help="unverified-users: only users registered more than N days ago")
+        parser.add_argument("--format", choices=FORMATS, default="jsonl")
+        parser.add_argument("--output", default="-", help="Output file, - for stdout")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Documents fetched per round trip")
+
+    def handle(self, *args, **options):
+        warning = session_store_warning() if options["report"] != "unverified-users" else None
+        if warning:
+            self.stderr.write(self.style.WARNING(warning))
+        if options["report"] == "summary":
+            for name, value in summary().items():
+                self.stdout.write("{}: {}".format(name, value))
+            return
+        if options["report"] == "active-sessions":
+            rows = active_session_users(batch_size=options["batch_size"])
+            fields = ACTIVE_SESSION_FIELDS
+        else:
+            rows = unverified_users(options["older_than_days"], batch_size=options["batch_size"])
+            fields = USER_FIELDS + ("created_at",)
+        count = write_output(rows, options["output"], options["format"], fields)
+        self.stderr.write("Reported {} rows".format(count))
@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...common.SessionAdmin import revoke_sessions_issued_before, revoke_user_sessions, revoke_all_sessions
+
+class Command(BaseCommand):
+    help = "Revoke sessions in bulk: issued before a timestamp, of given users, or all of them"
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument("--before", help="Revoke sessions issued before this timestamp (ISO 8601, e.g. 2024-01-31T12:00:00, UTC unless it has an offset)")
+        scope.add_argument("--users", nargs="+", metavar="USER_ID", help="Revoke every session of these user ids")
+        scope.add_argument("--all", action="store_true", help="Revoke every session, e.g. after rotating SECRET_KEY")
+
+    def handle(self, *args, **options):
+        if options["before"]:
+            try:
+                timestamp = datetime.fromisoformat(options["before"])
+            except ValueError:
+                raise CommandError("--before must be an ISO 8601 timestamp, got {}".format(options["before"]))
+            if timestamp.tzinfo:
+                # the session stores compare naive UTC datetimes
+                timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+            result = revoke_sessions_issued_before(timestamp)
+        elif options["users"]:
+            result = revoke_user_sessions(options["users"])
+        else:
+            result = revoke_all_sessions()
+        self.stdout.write("Revoked {}: removed {} session documents ({:.3f}s)".format(
+            result.scope,
+            result.deleted,
+            result.elapsed
+        ))
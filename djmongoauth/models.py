@@ -4,28 +4,63 @@ import secrets
 import json
 
 from django.conf import settings
+from django.db import router
 from djongo import models
-from djongo.sql2mongo import SQLDecodeError
-from django.contrib.auth.hashers import make_password, check_password
 from bson.objectid import ObjectId
+from django.contrib.auth.hashers import make_password, check_password
 
 from .DjMongoAuthError import DjMongoAuthError
+from .DjMongoAuthUnavailableError import DjMongoAuthUnavailableError
 from .common.EmailFactory import EmailFactory
 from .common.EmailTypes import EmailTypes
 from .common.EmailUtils import send_email
+from .common.AsyncEmail import asend_email
+from .common.EmailQueue import ASYNC_EMAIL, email_queue
+from .common.EmailCooldown import email_cooldown
+from .common.SMTPConnectionPool import smtp_pool, SendResult
+from .common.HashingPool import hashing_pool
+from .common.RateLimiter import login_throttle
+from .common.Instrumentation import instrumentation
+from .repositories import get_repository, get_async_repository
+from .sessions import get_session_store, get_async_session_store
+from .common.InvalidationBus import invalidation_bus
+from .common.RevocationList import revocation_list
+from .common.AuthToken import AuthToken
+from .common.TokenUtils import (
+    SIGNED_TOKENS, COMPACT_SESSIONS, HASHED_KEY_LENGTH, sign_token, has_valid_signature, derive_session_key,
+    hash_session_key, session_key_digest, hashed_key_digest
+)
+
+LOGIN_FIELDS = ("_id", "username", "password")
+EMAIL_FIELDS = ("_id", "username", "email")
 
 class TemporaryAuthenticator(models.Model):
     _id = models.ObjectIdField()
     user_id = models.CharField(max_length=128)
     expires_at = models.DateTimeField()
     authenticator = models.CharField(max_length=128, default=None)
+    # EmailTypes value; None for authenticators issued before the type was recorded
+    email_type = models.CharField(max_length=16, default=None)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["authenticator"]),
+            models.Index(fields=["user_id", "email_type"])
+        ]
 
     def generate_authenticator(self):
         self.authenticator = secrets.token_urlsafe(64)
 
     # TODO use custom django setting value
     def set_expires_at(self):
-        self.expires_at = datetime.now() + timedelta(hours=1)
+        self.expires_at = datetime.now() + TemporaryAuthenticator.get_lifetime()
+
+    @staticmethod
+    def get_lifetime()->timedelta:
+        return timedelta(hours=1)
+
+    def get_issued_at(self)->datetime:
+        return self.expires_at.replace(tzinfo=None) - TemporaryAuthenticator.get_lifetime()
 
     def has_expired(self)->bool:
         expires_at_ntz = self.expires_at.replace(tzinfo=None)
@@ -34,9 +69,11 @@ class TemporaryAuthenticator(models.Model):
 class Session(models.Model):
     _id = models.ObjectIdField()
     session_key = models.CharField(max_length=255, unique=True)
-    user_id = models.CharField(max_length=128)
+    # one session document per user: login reuses it while valid and replaces it in place once expired
+    user_id = models.CharField(max_length=128, unique=True)
     expires_at = models.DateTimeField()
-    x_auth_token = models.CharField(max_length=1024, unique=True)
+    # unique through session_key; None for compact sessions, whose token is rebuilt by build_x_auth_token()
+    x_auth_token = models.CharField(max_length=1024, default=None)
 
     def has_expired(self)->bool:
         # both datetime.now() and self.expires_at are in UTC, so removing tz awareness from self.expires_at
@@ -44,33 +81,75 @@ class Session(models.Model):
         return expires_at_ntz < datetime.now()
     
     def set_expires_at(self):
-        self.expires_at = datetime.now() + timedelta(hours=settings.SESSION_EXPIRE_IN_HOUR) # expires in a week
+        self.expires_at = datetime.now() + Session.get_lifetime() # expires in a week
+
+    @staticmethod
+    def get_lifetime()->timedelta:
+        return timedelta(hours=settings.SESSION_EXPIRE_IN_HOUR)
     
     def generate_x_auth_token(self, username:str):
+        self.x_auth_token = None if COMPACT_SESSIONS else self.build_x_auth_token(username)
+
+    def build_x_auth_token(self, username:str)->str:
         assert self.session_key
         assert self.user_id
         assert self.expires_at
-        self.x_auth_token = "exp={}&user_id={}&username={}&session_key={}".format(
-            calendar.timegm(self.expires_at.utctimetuple()),
+        x_auth_token = "exp={}&user_id={}&username={}&session_key={}".format(
+            self.get_exp(),
             self.user_id,
             username,
-            self.session_key
+            self._derive_key() if COMPACT_SESSIONS else self.session_key
         )
+        return sign_token(x_auth_token) if SIGNED_TOKENS else x_auth_token
+
+    def get_exp(self)->int:
+        return calendar.timegm(self.expires_at.utctimetuple())
 
     def generate_session_key(self):
-        self.session_key = secrets.token_urlsafe(128)
+        if COMPACT_SESSIONS:
+            self.session_key = hash_session_key(self._derive_key())
+        else:
+            self.session_key = secrets.token_urlsafe(128)
+
+    def has_derived_key(self)->bool:
+        # False for a session hashed by djmongoauth_compact_sessions: its random key cannot be rebuilt
+        return self.session_key == hash_session_key(self._derive_key())
+
+    def _derive_key(self)->str:
+        # expires_at to the millisecond, as MongoDB stores it: a session replacing one that was just ended
+        # does not get its key back
+        return derive_session_key(self.user_id, self.get_exp() * 1000 + self.expires_at.microsecond // 1000)
+
+    def get_key_digest(self)->str:
+        # a hashed key is 43 characters, a random one 171
+        if len(self.session_key) == HASHED_KEY_LENGTH:
+            return hashed_key_digest(self.session_key)
+        return session_key_digest(self.session_key)
+
+    @staticmethod
+    def lookup_key(session_key:str)->str:
+        # the form of a token's session key that sessions are stored and looked up by
+        return hash_session_key(session_key) if COMPACT_SESSIONS else session_key
     
     @staticmethod
-    def parse_x_auth_token(x_auth_token:str)->tuple:
-        tokens = x_auth_token.split("&")
-        if len(tokens) < 3:
-            raise DjMongoAuthError("Failed to parse x_auth_token: {}".format(x_auth_token))
-        return (
-            tokens[0].split("=")[1],
-            tokens[1].split("=")[1],
-            tokens[2].split("=")[1],
-            tokens[3].split("=")[1]
-        )
+    def parse_x_auth_token(x_auth_token:str)->AuthToken:
+        return AuthToken.parse(x_auth_token)
+
+    @staticmethod
+    def verify_signed_x_auth_token(token:AuthToken):
+        # checks signature, expiry and revocation without touching the database
+        if not has_valid_signature(token.raw):
+            raise DjMongoAuthError("Invalid x_auth_token signature")
+        if calendar.timegm(datetime.now().utctimetuple()) > token.exp:
+            raise DjMongoAuthError("x_auth_token has expired")
+        # tokens carry no issue time; it is exp minus the session lifetime
+        issued_at = token.exp - int(Session.get_lifetime().total_seconds())
+        if revocation_list.is_revoked(session_key_digest(token.session_key), user_id=token.user_id, issued_at=issued_at):
+            raise DjMongoAuthError("Session has been revoked")
+
+    @staticmethod
+    def revoke(sessions):
+        revocation_list.revoke((s.get_key_digest(), s.get_exp()) for s in sessions)
 
 class User(models.Model):
     _id = models.ObjectIdField()
@@ -80,108 +159,365 @@ class User(models.Model):
     email_verified = models.BooleanField(default=False)
     email_verified_at = models.DateTimeField(default=None)
 
+    @staticmethod
+    def deferred(user_id:str):
+        # a User with every field but _id deferred; each field is loaded on first access
+        return User.from_db(router.db_for_read(User), ["_id"], [ObjectId(user_id)])
+
+    def refresh_from_db(self, using=None, fields=None):
+        # deferred fields are loaded through the configured repository, only the ones asked for
+        if not fields:
+            return super().refresh_from_db(using=using, fields=fields)
+        user = get_repository().get_user_by_id(str(self._id), fields=("_id",) + tuple(fields))
+        for name in fields:
+            setattr(self, name, getattr(user, name))
+
+    async def arefresh_from_db(self, using=None, fields=None):
+        # async views load deferred fields explicitly, e.g. await request.djmongoauth_user.arefresh_from_db(fields=["email"])
+        fields = tuple(fields) if fields else tuple(f.attname for f in User._meta.concrete_fields if f.attname != "_id")
+        user = await get_async_repository().get_user_by_id(str(self._id), fields=("_id",) + fields)
+        for name in fields:
+            setattr(self, name, getattr(user, name))
+
+    @instrumentation.instrument("register")
     def register(self):
-        try:
+        with instrumentation.phase("hash"):
             self.password = make_password(self.password)
-            self.save()
-        except SQLDecodeError as e:
-            raise DjMongoAuthError("Username or email has already been registered")
+        get_repository().insert_user(self)
+
+    async def aregister(self):
+        # same as register(), with hashing done in the bounded hashing pool
+        self.password = await hashing_pool.run(make_password, self.password)
+        await get_async_repository().insert_user(self)
+
+    @staticmethod
+    @instrumentation.instrument("bulk_register")
+    def bulk_register(users, hash_passwords:bool=True)->list:
+        # hashes in parallel on the hashing pool, then inserts with a single bulk write
+        # returns (index, error) for every user that was not inserted; the others are saved
+        users = list(users)
+        if hash_passwords:
+            with instrumentation.phase("hash"):
+                passwords = hashing_pool.map(make_password, [user.password for user in users])
+            for user, password in zip(users, passwords):
+                user.password = password
+        return get_repository().insert_users(users)
+
+    @staticmethod
+    @instrumentation.instrument("login")
+    def login(username, password, client_ip:str=None)->str:
+        # throttled per username and per client ip before any DB or hashing work; only an unknown username or
+        # a wrong password counts as a failure, not a DjMongoAuthUnavailableError
+        login_throttle.check(username, client_ip)
+        try:
+            user = User._get_by_username(username)
+            with instrumentation.phase("hash"):
+                password_matches = check_password(password, user.password)
+            if not password_matches:
+                raise DjMongoAuthError("Password is incorrect for user {}".format(username))
+        except DjMongoAuthUnavailableError:
+            raise
+        except DjMongoAuthError:
+            login_throttle.record_failure(username, client_ip)
+            raise
+        login_throttle.record_success(username)
+        return User._get_or_create_session(user, username)
+
+    @staticmethod
+    async def alogin(username, password, client_ip:str=None)->str:
+        login_throttle.check(username, client_ip)
+        try:
+            user = await User._aget_by_username(username)
+            if not await hashing_pool.run(check_password, password, user.password):
+                raise DjMongoAuthError("Password is incorrect for user {}".format(username))
+        except DjMongoAuthUnavailableError:
+            raise
+        except DjMongoAuthError:
+            login_throttle.record_failure(username, client_ip)
+            raise
+        login_throttle.record_success(username)
+        return await User._aget_or_create_session(user, username)
 
     @staticmethod
-    def login(username, password)->str:
+    def _get_by_username(username):
         try:
-            user = User.objects.get(username=username)
+            return get_repository().get_user_by_username(username, fields=LOGIN_FIELDS)
+        except User.DoesNotExist as e:
+            raise DjMongoAuthError(str(e))
         except Exception as e:
+            raise DjMongoAuthUnavailableError(str(e))
+
+    @staticmethod
+    async def _aget_by_username(username):
+        try:
+            return await get_async_repository().get_user_by_username(username, fields=LOGIN_FIELDS)
+        except User.DoesNotExist as e:
             raise DjMongoAuthError(str(e))
-        if not check_password(password, user.password):
-            raise DjMongoAuthError("Password is incorrect for user {}".format(username))
+        except Exception as e:
+            raise DjMongoAuthUnavailableError(str(e))
+
+    @staticmethod
+    def _get_or_create_session(user, username)->str:
         try:
-            existing_sessions = Session.objects.filter(user_id=str(user._id))
-            for s in existing_sessions:
-                if not s.has_expired():
-                    return s.x_auth_token
+            # returns the user's still valid session if there is one, new_session otherwise
+            session_store = get_session_store()
+            session = session_store.get_or_create_session(User._new_session(user, username))
+            if COMPACT_SESSIONS:
+                if not session.has_derived_key():
+                    # its token cannot be rebuilt: end it and start a new one
+                    User._end_sessions(session.user_id)
+                    session = session_store.get_or_create_session(User._new_session(user, username))
+                return session.build_x_auth_token(username)
+            if User._needs_signing(session, username):
+                session_store.update_session(session, x_auth_token=session.x_auth_token)
         except Exception as e:
             raise DjMongoAuthError(str(e))
+        return session.x_auth_token
+
+    @staticmethod
+    async def _aget_or_create_session(user, username)->str:
+        session_store = get_async_session_store()
+        try:
+            session = await session_store.get_or_create_session(User._new_session(user, username))
+            if COMPACT_SESSIONS:
+                if not session.has_derived_key():
+                    await User._aend_sessions(session.user_id)
+                    session = await session_store.get_or_create_session(User._new_session(user, username))
+                return session.build_x_auth_token(username)
+            if User._needs_signing(session, username):
+                await session_store.update_session(session, x_auth_token=session.x_auth_token)
+        except Exception as e:
+            raise DjMongoAuthError(str(e))
+        return session.x_auth_token
+
+    @staticmethod
+    def _new_session(user, username)->"Session":
         new_session = Session()
         new_session.user_id = str(user._id)
         new_session.set_expires_at()
         new_session.generate_session_key()
         new_session.generate_x_auth_token(username=username)
-        new_session.save()
-        return new_session.x_auth_token
+        return new_session
 
     @staticmethod
+    def _needs_signing(session, username)->bool:
+        if SIGNED_TOKENS and not has_valid_signature(session.x_auth_token):
+            # session was issued before token signing was turned on
+            session.generate_x_auth_token(username=username)
+            return True
+        return False
+
+    @staticmethod
+    @instrumentation.instrument("logout")
     def logout(request):
         # don't fail silently here (unlike default django logout() call)
-        x_auth_token = request.META.get("HTTP_AUTHORIZATION")
-        if not x_auth_token:
-            raise DjMongoAuthError("No token found in request header!")
-        exp, user_id, _, session_key = Session.parse_x_auth_token(x_auth_token)
-        if calendar.timegm(datetime.now().utctimetuple()) > int(exp):
+        token = AuthToken.from_request(request)
+        user_id = token.user_id
+        if calendar.timegm(datetime.now().utctimetuple()) > token.exp:
             raise DjMongoAuthError("Unable to log out since token has already expired")
-        has_valid_session = False 
-        existing_sessions = Session.objects.filter(user_id=user_id)
-        if len(existing_sessions):
-            for s in existing_sessions:
-                if not s.has_expired() and s.session_key == session_key:
-                    has_valid_session = True 
-                    break
-        if not has_valid_session:
+        if not get_session_store().get_active_session(user_id=user_id, session_key=Session.lookup_key(token.session_key)):
             raise DjMongoAuthError("Session key not found!")
         # delete all sessions
-        existing_sessions.delete()
+        User._end_sessions(user_id)
+
+    @staticmethod
+    async def alogout(request):
+        token = AuthToken.from_request(request)
+        user_id = token.user_id
+        if calendar.timegm(datetime.now().utctimetuple()) > token.exp:
+            raise DjMongoAuthError("Unable to log out since token has already expired")
+        if not await get_async_session_store().get_active_session(user_id=user_id, session_key=Session.lookup_key(token.session_key)):
+            raise DjMongoAuthError("Session key not found!")
+        await User._aend_sessions(user_id)
 
     @staticmethod
-    def send_email(request, type:EmailTypes):
-        user_id = Session.parse_x_auth_token(request.META["HTTP_AUTHORIZATION"])[1]
+    @instrumentation.instrument("send_email")
+    def send_email(request, type:EmailTypes)->bool:
+        # returns False when the send was suppressed because the same email went out within the cooldown
+        user_id = AuthToken.from_request(request).user_id
+        if User._is_cooling_down(user_id, type):
+            return False
+        repository = get_repository()
         user = None 
         try:
-            user = User.objects.get(_id=ObjectId(user_id))
+            user = repository.get_user_by_id(user_id, fields=EMAIL_FIELDS)
         except Exception:
             raise DjMongoAuthError("User not found!")
+        temp_auth = repository.get_active_temp_auth(user_id, type.value) if email_cooldown.enabled else None
+        if User._sent_elsewhere(user_id, type, temp_auth):
+            return False
+        outcome, temp_auth = User._reuse_or_create_temp_auth(user_id, type, temp_auth)
+        if outcome == "sent":
+            repository.insert_temp_auths([temp_auth])
+        try:
+            mail_to_be_sent = User._generate_email(type, temp_auth, user)
+            if ASYNC_EMAIL:
+                email_queue.enqueue(mail_to_be_sent)
+            else:
+                with instrumentation.phase("smtp"):
+                    send_email(mail_to_be_sent)
+        except Exception as e:
+            raise User._send_error(type, e)
+        User._record_send(user_id, type, outcome)
+        return True
+
+    @staticmethod
+    async def asend_email(request, type:EmailTypes)->bool:
+        # same as send_email(); the message goes out through aiosmtplib when installed (see AsyncEmail)
+        user_id = AuthToken.from_request(request).user_id
+        if User._is_cooling_down(user_id, type):
+            return False
+        repository = get_async_repository()
+        try:
+            user = await repository.get_user_by_id(user_id, fields=EMAIL_FIELDS)
+        except Exception:
+            raise DjMongoAuthError("User not found!")
+        temp_auth = await repository.get_active_temp_auth(user_id, type.value) if email_cooldown.enabled else None
+        if User._sent_elsewhere(user_id, type, temp_auth):
+            return False
+        outcome, temp_auth = User._reuse_or_create_temp_auth(user_id, type, temp_auth)
+        if outcome == "sent":
+            await repository.insert_temp_auths([temp_auth])
+        try:
+            mail_to_be_sent = User._generate_email(type, temp_auth, user)
+            if ASYNC_EMAIL:
+                email_queue.enqueue(mail_to_be_sent)
+            else:
+                await asend_email(mail_to_be_sent)
+        except Exception as e:
+            raise User._send_error(type, e)
+        User._record_send(user_id, type, outcome)
+        return True
+
+    @staticmethod
+    def _is_cooling_down(user_id:str, type:EmailTypes)->bool:
+        if email_cooldown.is_cooling_down(user_id, type):
+            email_cooldown.record(type, "suppressed")
+            return True
+        return False
+
+    @staticmethod
+    def _sent_elsewhere(user_id:str, type:EmailTypes, temp_auth)->bool:
+        # temp_auth was issued by another process within the cooldown
+        if temp_auth and (datetime.now() - temp_auth.get_issued_at()).total_seconds() < email_cooldown.cooldown:
+            email_cooldown.remember(user_id, type, calendar.timegm(temp_auth.get_issued_at().utctimetuple()))
+            email_cooldown.record(type, "suppressed")
+            return True
+        return False
+
+    @staticmethod
+    def _reuse_or_create_temp_auth(user_id:str, type:EmailTypes, temp_auth)->tuple:
+        # an authenticator with at least half of its lifetime left is sent again instead of issuing a new one
+        if temp_auth and temp_auth.expires_at.replace(tzinfo=None) - datetime.now() >= TemporaryAuthenticator.get_lifetime() / 2:
+            return "reused", temp_auth
         temp_auth = TemporaryAuthenticator()
         temp_auth.user_id = user_id
+        temp_auth.email_type = type.value
         temp_auth.generate_authenticator()
         temp_auth.set_expires_at()
-        temp_auth.save()
+        return "sent", temp_auth
+
+    @staticmethod
+    def _generate_email(type:EmailTypes, temp_auth, user):
+        mail_to_be_sent = None 
+        if type == EmailTypes.VERIFY:
+            mail_to_be_sent = EmailFactory.generate_email(type=EmailTypes.VERIFY, temp_auth=temp_auth, user=user)
+        elif type == EmailTypes.RESET:
+            mail_to_be_sent = EmailFactory.generate_email(type=EmailTypes.RESET, temp_auth=temp_auth, user=user)
+        assert mail_to_be_sent
+        return mail_to_be_sent
+
+    @staticmethod
+    def _send_error(type:EmailTypes, e:Exception)->DjMongoAuthError:
+        if type == EmailTypes.VERIFY:
+            return DjMongoAuthError("Failed to send verification email: {}".format(str(e)))
+        return DjMongoAuthError("Failed to send password reset email: {}".format(str(e)))
+
+    @staticmethod
+    def _record_send(user_id:str, type:EmailTypes, outcome:str):
+        email_cooldown.remember(user_id, type)
+        email_cooldown.record(type, outcome)
+
+    @staticmethod
+    def send_bulk_email(users, type:EmailTypes)->SendResult:
+        # one authenticator insert round trip, emails sent in batches over pooled connections; emails that
+        # could not be sent are listed in the result, their authenticators expire unused
+        users = list(users)
+        temp_auths = []
+        for user in users:
+            temp_auth = TemporaryAuthenticator()
+            temp_auth.user_id = str(user._id)
+            temp_auth.email_type = type.value
+            temp_auth.generate_authenticator()
+            temp_auth.set_expires_at()
+            temp_auths.append(temp_auth)
+        get_repository().insert_temp_auths(temp_auths)
         try:
-            mail_to_be_sent = None 
-            if type == EmailTypes.VERIFY:
-                mail_to_be_sent = EmailFactory.generate_email(type=EmailTypes.VERIFY, temp_auth=temp_auth, user=user)
-            elif type == EmailTypes.RESET:
-                mail_to_be_sent = EmailFactory.generate_email(type=EmailTypes.RESET, temp_auth=temp_auth, user=user)
-            assert mail_to_be_sent
-            send_email(mail_to_be_sent)
+            return smtp_pool.send_emails(EmailFactory.generate_emails(type, zip(users, temp_auths)))
         except Exception as e:
-            if type == EmailTypes.VERIFY:
-                raise DjMongoAuthError("Failed to send verification email: {}".format(str(e)))
-            elif type == EmailTypes.RESET:
-                raise DjMongoAuthError("Failed to send password reset email: {}".format(str(e)))
+            raise DjMongoAuthError("Failed to send {} emails: {}".format(type.value.lower(), str(e)))
 
     @staticmethod
+    @instrumentation.instrument("handle_email_request")
     def handle_email_request(request, type:EmailTypes):
+        # the authenticator is consumed and the user updated in one repository call, so a link works once
+        # even when submitted concurrently; the new password is hashed first to keep that call short
         try:
-            authenticator = request.GET.get("a", None)
-            assert authenticator
-            temp_auth = TemporaryAuthenticator.objects.get(authenticator=authenticator)
-            if temp_auth.has_expired():
-                raise DjMongoAuthError("Invalid session!")
-            user = User.objects.get(_id=ObjectId(temp_auth.user_id))
-            if type == EmailTypes.VERIFY:
-                user.email_verified = True 
-                user.email_verified_at = datetime.now()
-                user.save()
-            elif type == EmailTypes.RESET:
-                req_body = json.loads(request.body.decode("UTF-8"))
-                user.password = make_password(req_body["new_password"])
-                user.save()
-                # clear all existing sessions
-                Session.objects.filter(user_id=str(user._id)).delete()
-            temp_auth.delete()
+            authenticator = User._get_authenticator(request)
+            if type == EmailTypes.RESET:
+                new_password = User._get_new_password(request)
+                with instrumentation.phase("hash"):
+                    fields = {"password": make_password(new_password)}
+            else:
+                fields = User._verified_fields()
+            user_id = get_repository().consume_temp_auth(authenticator, type.value, **fields)
+            if type == EmailTypes.RESET:
+                User._end_sessions(user_id)
         except Exception as e:
             raise DjMongoAuthError("Cannot process email verification request: {}".format(str(e))) 
 
+    @staticmethod
+    async def ahandle_email_request(request, type:EmailTypes):
+        try:
+            authenticator = User._get_authenticator(request)
+            if type == EmailTypes.RESET:
+                new_password = User._get_new_password(request)
+                fields = {"password": await hashing_pool.run(make_password, new_password)}
+            else:
+                fields = User._verified_fields()
+            user_id = await get_async_repository().consume_temp_auth(authenticator, type.value, **fields)
+            if type == EmailTypes.RESET:
+                await User._aend_sessions(user_id)
+        except Exception as e:
+            raise DjMongoAuthError("Cannot process email verification request: {}".format(str(e)))
 
+    @staticmethod
+    def _get_authenticator(request)->str:
+        authenticator = request.GET.get("a", None)
+        assert authenticator
+        return authenticator
 
+    @staticmethod
+    def _get_new_password(request)->str:
+        req_body = json.loads(request.body.decode("UTF-8"))
+        return req_body["new_password"]
 
-    
\ No newline at end of file
+    @staticmethod
+    def _verified_fields()->dict:
+        return {"email_verified": True, "email_verified_at": datetime.now()}
+
+    @staticmethod
+    def _end_sessions(user_id:str):
+        session_store = get_session_store()
+        if SIGNED_TOKENS:
+            Session.revoke(session_store.get_active_sessions(user_id))
+        session_store.delete_sessions(user_id)
+        invalidation_bus.publish_users([user_id])
+
+    @staticmethod
+    async def _aend_sessions(user_id:str):
+        session_store = get_async_session_store()
+        if SIGNED_TOKENS:
+            Session.revoke(await session_store.get_active_sessions(user_id))
+        await session_store.delete_sessions(user_id)
+        invalidation_bus.publish_users([user_id])
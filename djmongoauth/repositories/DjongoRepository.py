@@ -0,0 +1,138 @@
+from datetime import datetime
+
+from djongo.sql2mongo import SQLDecodeError
+from bson.objectid import ObjectId
+
+from ..models import User, Session, TemporaryAuthenticator
+from ..DjMongoAuthError import DjMongoAuthError
+
+# reads and writes auth models through djongo's ORM
+class DjongoRepository():
+    def get_user_by_username(self, username:str, fields:tuple=None)->User:
+        return self._users(fields).get(username=username)
+
+    def get_user_by_id(self, user_id:str, fields:tuple=None)->User:
+        return self._users(fields).get(_id=ObjectId(user_id))
+
+    def user_exists(self, user_id:str)->bool:
+        # an _id-only get() translates to a plain find; djongo turns exists() into a slower aggregation
+        try:
+            self.get_user_by_id(user_id, fields=("_id",))
+        except User.DoesNotExist:
+            return False
+        return True
+
+    def insert_user(self, user:User):
+        try:
+            user.save()
+        except SQLDecodeError as e:
+            raise DjMongoAuthError("Username or email has already been registered")
+
+    def insert_users(self, users:list)->list:
+        # the ORM cannot tell which rows of a failed bulk insert conflicted, so conflicts with
+        # existing users and within the batch are found up front and only the rest is inserted
+        taken = {
+            "username": set(User.objects.filter(username__in=[u.username for u in users]).values_list("username", flat=True)),
+            "email": set(User.objects.filter(email__in=[u.email for u in users]).values_list("email", flat=True))
+        }
+        errors = []
+        pending = []
+        for index, user in enumerate(users):
+            conflict = next((name for name in ("username", "email") if getattr(user, name) in taken[name]), None)
+            if conflict:
+                errors.append((index, "{} has already been registered".format(conflict.capitalize())))
+                continue
+            taken["username"].add(user.username)
+            taken["email"].add(user.email)
+            pending.append((index, user))
+        try:
+            User.objects.bulk_create([user for _, user in pending])
+        except Exception as e:
+            # a concurrent registration won a race; nothing tells which of these made it in
+            errors.extend((index, str(e)) for index, _ in pending)
+        return sorted(errors)
+
+    def get_active_session(self, **filters):
+        # expiry is checked by the database so lookups stay on the user_id / session_key indexes
+        return Session.objects.filter(expires_at__gt=datetime.now(), **filters).first()
+
+    def get_active_sessions(self, user_id:str)->list:
+        return list(Session.objects.filter(expires_at__gt=datetime.now(), user_id=user_id))
+
+    def get_or_create_session(self, new_session:Session)->Session:
+        # read-then-write; concurrent first logins are settled by the unique user_id index, concurrent
+        # takeovers of an expired session by a conditional update only one of them can win
+        existing_session = Session.objects.filter(user_id=new_session.user_id).first()
+        if existing_session and not existing_session.has_expired():
+            return existing_session
+        if existing_session:
+            fields = {
+                field.attname: getattr(new_session, field.attname)
+                for field in Session._meta.concrete_fields if field.attname not in ("_id", "user_id")
+            }
+            if Session.objects.filter(_id=existing_session._id, expires_at__lte=datetime.now()).update(**fields):
+                new_session._id = existing_session._id
+                return new_session
+        else:
+            try:
+                new_session.save()
+                return new_session
+            except Exception:
+                pass
+        # another login for this user wrote its session first
+        existing_session = Session.objects.filter(user_id=new_session.user_id).first()
+        if not existing_session or existing_session.has_expired():
+            raise DjMongoAuthError("Could not create a session for user {}".format(new_session.user_id))
+        return existing_session
+
+    def update_session(self, session:Session, **fields):
+        Session.objects.filter(_id=session._id).update(**fields)
+
+    def delete_sessions(self, user_id:str)->int:
+        return Session.objects.filter(user_id=user_id).delete()[0]
+
+    def get_sessions_expiring_after(self, expires_at:datetime, user_ids:list=None)->list:
+        sessions = Session.objects.filter(expires_at__gte=expires_at)
+        return list(sessions if user_ids is None else sessions.filter(user_id__in=user_ids))
+
+    def delete_sessions_of_users(self, user_ids:list)->int:
+        # Session has no relations or delete signals, so Django issues a single delete without loading rows
+        return Session.objects.filter(user_id__in=user_ids).delete()[0]
+
+    def delete_sessions_expiring_before(self, expires_at:datetime)->int:
+        return Session.objects.filter(expires_at__lt=expires_at).delete()[0]
+
+    def delete_all_sessions(self)->int:
+        return Session.objects.all().delete()[0]
+
+    def insert_temp_auths(self, temp_auths:list):
+        if len(temp_auths) == 1:
+            temp_auths[0].save()
+        else:
+            TemporaryAuthenticator.objects.bulk_create(temp_auths)
+
+    def get_active_temp_auth(self, user_id:str, email_type:str):
+        return TemporaryAuthenticator.objects.filter(
+            user_id=user_id,
+            email_type=email_type,
+            expires_at__gt=datetime.now()
+        ).order_by("-expires_at").first()
+
+    def consume_temp_auth(self, authenticator:str, email_type:str, **fields)->str:
+        # the ORM has no find-and-delete: the request whose delete removes the authenticator owns it,
+        # a concurrent one using the same link deletes nothing and fails
+        temp_auth = TemporaryAuthenticator.objects.filter(
+            authenticator=authenticator,
+            expires_at__gt=datetime.now()
+        ).only("_id", "user_id", "email_type").first()
+        if temp_auth is None or temp_auth.email_type not in (None, email_type):
+            raise DjMongoAuthError("Invalid session!")
+        if TemporaryAuthenticator.objects.filter(_id=temp_auth._id).delete()[0] == 0:
+            raise DjMongoAuthError("Invalid session!")
+        if User.objects.filter(_id=ObjectId(temp_auth.user_id)).update(**fields) == 0:
+            raise DjMongoAuthError("User not found!")
+        return temp_auth.user_id
+
+    def _users(self, fields:tuple=None):
+        # fields limits the columns fetched; the others are deferred
+        return User.objects.only(*fields) if fields else User.objects.all()
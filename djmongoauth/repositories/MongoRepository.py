@@ -0,0 +1,211 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument, DESCENDING
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+
+from ..models import User, Session, TemporaryAuthenticator
+from ..DjMongoAuthError import DjMongoAuthError
+from ..common.MongoUtils import get_collection, to_document, from_document, to_mongo_value
+from ..common.Instrumentation import instrumentation
+
+DUPLICATE_KEY = 11000
+# consume_temp_auth() in a multi-document transaction (replica set or sharded cluster only)
+EMAIL_REQUEST_TRANSACTIONS = getattr(settings, "DJMONGOAUTH_EMAIL_REQUEST_TRANSACTIONS", False)
+
+# reads and writes auth models with PyMongo directly, skipping djongo's SQL translation
+# documents keep the exact shape djongo writes, so both repositories can be used against the same data
+class MongoRepository():
+    def get_user_by_username(self, username:str, fields:tuple=None)->User:
+        return self._get(User, {"username": username}, fields)
+
+    def get_user_by_id(self, user_id:str, fields:tuple=None)->User:
+        return self._get(User, {"_id": ObjectId(user_id)}, fields)
+
+    @instrumentation.query
+    def user_exists(self, user_id:str)->bool:
+        # answered from the _id index, no document is returned
+        return get_collection(User).count_documents({"_id": ObjectId(user_id)}, limit=1) > 0
+
+    @instrumentation.query
+    def insert_user(self, user:User):
+        try:
+            user._id = get_collection(User).insert_one(to_document(user)).inserted_id
+        except DuplicateKeyError:
+            raise DjMongoAuthError("Username or email has already been registered")
+
+    @instrumentation.query
+    def insert_users(self, users:list)->list:
+        # one unordered insert_many: a conflicting user does not stop the others from being written
+        documents = [to_document(user) for user in users]
+        errors = []
+        try:
+            get_collection(User).insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            errors = [(error["index"], write_error_message(error)) for error in e.details["writeErrors"]]
+        failed = {index for index, _ in errors}
+        for index, (user, document) in enumerate(zip(users, documents)):
+            if index not in failed:
+                user._id = document["_id"]
+        return errors
+
+    @instrumentation.query
+    def get_active_session(self, **filters):
+        document = get_collection(Session).find_one(active(Session, filters))
+        return from_document(Session, document) if document else None
+
+    @instrumentation.query
+    def get_active_sessions(self, user_id:str)->list:
+        cursor = get_collection(Session).find(
+            active(Session, {"user_id": user_id}),
+            {"session_key": 1, "user_id": 1, "expires_at": 1}
+        )
+        return [from_document(Session, document) for document in cursor]
+
+    @instrumentation.query
+    def get_or_create_session(self, new_session:Session)->Session:
+        # a single atomic round trip: keeps the user's session while it is valid, otherwise overwrites it
+        # with new_session (or inserts it); the unique user_id index makes concurrent upserts converge
+        update = session_upsert(new_session)
+        try:
+            document = self._upsert_session(new_session.user_id, update)
+        except DuplicateKeyError:
+            # the server only retries an upsert that lost the race itself when the filter is an exact match
+            # on the unique index; retry once in case it did not
+            document = self._upsert_session(new_session.user_id, update)
+        return from_document(Session, document)
+
+    def _upsert_session(self, user_id:str, update:list)->dict:
+        return get_collection(Session).find_one_and_update(
+            {"user_id": user_id},
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    @instrumentation.query
+    def update_session(self, session:Session, **fields):
+        get_collection(Session).update_one(
+            {"_id": session._id},
+            set_fields(Session, fields)
+        )
+
+    @instrumentation.query
+    def delete_sessions(self, user_id:str)->int:
+        return get_collection(Session).delete_many({"user_id": user_id}).deleted_count
+
+    @instrumentation.query
+    def get_sessions_expiring_after(self, expires_at:datetime, user_ids:list=None)->list:
+        query = {"expires_at": {"$gte": to_mongo_value(Session, "expires_at", expires_at)}}
+        if user_ids is not None:
+            query["user_id"] = {"$in": list(user_ids)}
+        cursor = get_collection(Session).find(query, {"session_key": 1, "user_id": 1, "expires_at": 1})
+        return [from_document(Session, document) for document in cursor]
+
+    @instrumentation.query
+    def delete_sessions_of_users(self, user_ids:list)->int:
+        return get_collection(Session).delete_many({"user_id": {"$in": list(user_ids)}}).deleted_count
+
+    @instrumentation.query
+    def delete_sessions_expiring_before(self, expires_at:datetime)->int:
+        return get_collection(Session).delete_many(
+            {"expires_at": {"$lt": to_mongo_value(Session, "expires_at", expires_at)}}
+        ).deleted_count
+
+    @instrumentation.query
+    def delete_all_sessions(self)->int:
+        return get_collection(Session).delete_many({}).deleted_count
+
+    @instrumentation.query
+    def insert_temp_auths(self, temp_auths:list):
+        result = get_collection(TemporaryAuthenticator).insert_many([to_document(t) for t in temp_auths])
+        for temp_auth, inserted_id in zip(temp_auths, result.inserted_ids):
+            temp_auth._id = inserted_id
+
+    @instrumentation.query
+    def get_active_temp_auth(self, user_id:str, email_type:str):
+        document = get_collection(TemporaryAuthenticator).find_one(
+            active(TemporaryAuthenticator, {"user_id": user_id, "email_type": email_type}),
+            sort=[("expires_at", DESCENDING)]
+        )
+        return from_document(TemporaryAuthenticator, document) if document else None
+
+    def consume_temp_auth(self, authenticator:str, email_type:str, **fields)->str:
+        # deletes the authenticator in the same operation that finds it, so only one request can use it,
+        # then sets fields on its user; returns the user's id
+        if not EMAIL_REQUEST_TRANSACTIONS:
+            return self._consume_temp_auth(authenticator, email_type, fields)
+        with get_collection(User).database.client.start_session() as session:
+            return session.with_transaction(lambda session: self._consume_temp_auth(authenticator, email_type, fields, session))
+
+    def _consume_temp_auth(self, authenticator:str, email_type:str, fields:dict, session=None)->str:
+        user_id = self._delete_temp_auth(authenticator, email_type, session)
+        self._set_user_fields(user_id, fields, session)
+        return user_id
+
+    @instrumentation.query
+    def _delete_temp_auth(self, authenticator:str, email_type:str, session=None)->str:
+        document = get_collection(TemporaryAuthenticator).find_one_and_delete(
+            unused_temp_auth(authenticator, email_type),
+            {"user_id": 1},
+            session=session
+        )
+        if document is None:
+            raise DjMongoAuthError("Invalid session!")
+        return document["user_id"]
+
+    @instrumentation.query
+    def _set_user_fields(self, user_id:str, fields:dict, session=None):
+        result = get_collection(User).update_one({"_id": ObjectId(user_id)}, set_fields(User, fields), session=session)
+        if result.matched_count == 0:
+            raise DjMongoAuthError("User not found!")
+
+    @instrumentation.query
+    def _get(self, model, query:dict, fields:tuple=None):
+        # mirrors Model.objects.get() for unique lookups; fields turns into a projection, the rest is deferred
+        document = get_collection(model).find_one(query, projection(model, fields))
+        if document is None:
+            raise not_found(model)
+        return from_document(model, document)
+
+# query builders shared with MotorRepository
+
+def projection(model, fields:tuple=None):
+    return {model._meta.get_field(name).column: 1 for name in fields} if fields else None
+
+def not_found(model):
+    return model.DoesNotExist("{} matching query does not exist.".format(model._meta.object_name))
+
+def active(model, filters:dict)->dict:
+    return dict(filters, expires_at={"$gt": to_mongo_value(model, "expires_at", timezone.now())})
+
+def session_upsert(new_session:Session)->list:
+    # pipeline update keeping every field of a still valid session and replacing them with new_session's otherwise
+    # (updates with an aggregation pipeline need MongoDB >= 4.2)
+    is_valid = {"$gt": ["$expires_at", to_mongo_value(Session, "expires_at", timezone.now())]}
+    document = to_document(new_session)
+    document.pop("_id", None)
+    document.pop("user_id")
+    return [{"$set": {
+        name: {"$cond": [is_valid, "$" + name, {"$literal": value}]}
+        for name, value in document.items()
+    }}]
+
+def unused_temp_auth(authenticator:str, email_type:str)->dict:
+    # a verification link cannot be used to reset the password and vice versa; authenticators
+    # issued before email_type was recorded have none
+    return active(TemporaryAuthenticator, {"authenticator": authenticator, "email_type": {"$in": [None, email_type]}})
+
+def set_fields(model, fields:dict)->dict:
+    return {"$set": {name: to_mongo_value(model, name, value) for name, value in fields.items()}}
+
+def write_error_message(error:dict)->str:
+    if error.get("code") != DUPLICATE_KEY:
+        return error.get("errmsg", "Write error")
+    # keyValue is only reported by MongoDB 4.4+
+    fields = list(error.get("keyValue", {}))
+    if fields:
+        return "{} has already been registered".format(fields[0].capitalize())
+    return "Username or email has already been registered"
@@ -0,0 +1,125 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.db import router
+from django.utils.module_loading import import_string
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from ..models import User, Session, TemporaryAuthenticator
+from ..DjMongoAuthError import DjMongoAuthError
+from ..common.MongoUtils import to_document, from_document
+from .MongoRepository import projection, not_found, active, session_upsert, unused_temp_auth, set_fields, EMAIL_REQUEST_TRANSACTIONS
+
+# async counterpart of MongoRepository on top of Motor (pip install motor); every method is a coroutine
+# the client class is DJMONGOAUTH_MOTOR_CLIENT, built with the djongo CLIENT options of the models' database,
+# so tests can substitute a stand-in such as mongomock_motor.AsyncMongoMockClient
+class MotorRepository():
+    def __init__(self):
+        self._client_class = import_string(getattr(
+            settings,
+            "DJMONGOAUTH_MOTOR_CLIENT",
+            "motor.motor_asyncio.AsyncIOMotorClient"
+        ))
+        # Motor clients are bound to the event loop they were first used on
+        self._databases = weakref.WeakKeyDictionary()
+
+    async def get_user_by_username(self, username:str, fields:tuple=None)->User:
+        return await self._get(User, {"username": username}, fields)
+
+    async def get_user_by_id(self, user_id:str, fields:tuple=None)->User:
+        return await self._get(User, {"_id": ObjectId(user_id)}, fields)
+
+    async def user_exists(self, user_id:str)->bool:
+        return await self._collection(User).count_documents({"_id": ObjectId(user_id)}, limit=1) > 0
+
+    async def insert_user(self, user:User):
+        try:
+            user._id = (await self._collection(User).insert_one(to_document(user))).inserted_id
+        except DuplicateKeyError:
+            raise DjMongoAuthError("Username or email has already been registered")
+
+    async def get_active_session(self, **filters):
+        document = await self._collection(Session).find_one(active(Session, filters))
+        return from_document(Session, document) if document else None
+
+    async def get_active_sessions(self, user_id:str)->list:
+        cursor = self._collection(Session).find(
+            active(Session, {"user_id": user_id}),
+            {"session_key": 1, "user_id": 1, "expires_at": 1}
+        )
+        return [from_document(Session, document) async for document in cursor]
+
+    async def get_or_create_session(self, new_session:Session)->Session:
+        update = session_upsert(new_session)
+        try:
+            document = await self._upsert_session(new_session.user_id, update)
+        except DuplicateKeyError:
+            document = await self._upsert_session(new_session.user_id, update)
+        return from_document(Session, document)
+
+    async def update_session(self, session:Session, **fields):
+        await self._collection(Session).update_one({"_id": session._id}, set_fields(Session, fields))
+
+    async def delete_sessions(self, user_id:str)->int:
+        return (await self._collection(Session).delete_many({"user_id": user_id})).deleted_count
+
+    async def insert_temp_auths(self, temp_auths:list):
+        result = await self._collection(TemporaryAuthenticator).insert_many([to_document(t) for t in temp_auths])
+        for temp_auth, inserted_id in zip(temp_auths, result.inserted_ids):
+            temp_auth._id = inserted_id
+
+    async def get_active_temp_auth(self, user_id:str, email_type:str):
+        document = await self._collection(TemporaryAuthenticator).find_one(
+            active(TemporaryAuthenticator, {"user_id": user_id, "email_type": email_type}),
+            sort=[("expires_at", DESCENDING)]
+        )
+        return from_document(TemporaryAuthenticator, document) if document else None
+
+    async def consume_temp_auth(self, authenticator:str, email_type:str, **fields)->str:
+        if not EMAIL_REQUEST_TRANSACTIONS:
+            return await self._consume_temp_auth(authenticator, email_type, fields)
+        async with await self._collection(User).database.client.start_session() as session:
+            return await session.with_transaction(lambda session: self._consume_temp_auth(authenticator, email_type, fields, session))
+
+    async def _consume_temp_auth(self, authenticator:str, email_type:str, fields:dict, session=None)->str:
+        document = await self._collection(TemporaryAuthenticator).find_one_and_delete(
+            unused_temp_auth(authenticator, email_type),
+            {"user_id": 1},
+            session=session
+        )
+        if document is None:
+            raise DjMongoAuthError("Invalid session!")
+        result = await self._collection(User).update_one(
+            {"_id": ObjectId(document["user_id"])},
+            set_fields(User, fields),
+            session=session
+        )
+        if result.matched_count == 0:
+            raise DjMongoAuthError("User not found!")
+        return document["user_id"]
+
+    async def _get(self, model, query:dict, fields:tuple=None):
+        document = await self._collection(model).find_one(query, projection(model, fields))
+        if document is None:
+            raise not_found(model)
+        return from_document(model, document)
+
+    async def _upsert_session(self, user_id:str, update:list)->dict:
+        return await self._collection(Session).find_one_and_update(
+            {"user_id": user_id},
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _collection(self, model):
+        loop = asyncio.get_running_loop()
+        database = self._databases.get(loop)
+        if database is None:
+            config = settings.DATABASES[router.db_for_write(model)]
+            database = self._client_class(**config.get("CLIENT", {}))[config["NAME"]]
+            self._databases[loop] = database
+        return database[model._meta.db_table]
@@ -0,0 +1,9 @@
+from asgiref.sync import sync_to_async
+
+# default async repository: runs the configured sync repository's methods in a worker thread
+class SyncToAsyncRepository():
+    def __init__(self, repository):
+        self.repository = repository
+
+    def __getattr__(self, name:str):
+        return sync_to_async(getattr(self.repository, name))
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_repository = None
+_async_repository = None
+
+def get_repository():
+    # DJMONGOAUTH_REPOSITORY selects how auth models are read and written:
+    # through djongo's ORM (default) or directly through PyMongo
+    global _repository
+    if _repository is None:
+        _repository = import_string(getattr(
+            settings,
+            "DJMONGOAUTH_REPOSITORY",
+            "djmongoauth.repositories.DjongoRepository.DjongoRepository"
+        ))()
+    return _repository
+
+def get_async_repository():
+    # DJMONGOAUTH_ASYNC_REPOSITORY selects the coroutine-based repository used by the a* model methods,
+    # e.g. MotorRepository; by default the sync repository runs in a worker thread
+    global _async_repository
+    if _async_repository is None:
+        path = getattr(settings, "DJMONGOAUTH_ASYNC_REPOSITORY", None)
+        if path:
+            _async_repository = import_string(path)()
+        else:
+            from .SyncToAsyncRepository import SyncToAsyncRepository
+            _async_repository = SyncToAsyncRepository(get_repository())
+    return _async_repository
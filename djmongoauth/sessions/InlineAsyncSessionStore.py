@@ -0,0 +1,12 @@
+# async view of a session store whose methods never block on I/O: they run on the event loop,
+# without the worker thread hop of sync_to_async
+class InlineAsyncSessionStore():
+    def __init__(self, store):
+        self.store = store
+
+    def __getattr__(self, name:str):
+        method = getattr(self.store, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
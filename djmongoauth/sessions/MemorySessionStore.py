@@ -0,0 +1,81 @@
+import threading
+from datetime import datetime
+
+from ..models import Session
+from .InlineAsyncSessionStore import InlineAsyncSessionStore
+
+# sessions in a dict of this process: no network round trip, but every worker process has its own sessions
+# and they are lost on restart; meant for single-process deployments and tests
+class MemorySessionStore():
+    def __init__(self):
+        # user_id -> (session_key, expires_at, x_auth_token); one session per user, like the Session collection
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get_active_session(self, user_id:str, session_key:str):
+        entry = self._sessions.get(user_id)
+        if entry is None or entry[0] != session_key or entry[1] <= datetime.now():
+            return None
+        return _to_session(user_id, entry)
+
+    def get_active_sessions(self, user_id:str)->list:
+        entry = self._sessions.get(user_id)
+        if entry is None or entry[1] <= datetime.now():
+            return []
+        return [_to_session(user_id, entry)]
+
+    def get_or_create_session(self, new_session:Session)->Session:
+        with self._lock:
+            entry = self._sessions.get(new_session.user_id)
+            if entry is not None and entry[1] > datetime.now():
+                return _to_session(new_session.user_id, entry)
+            self._sessions[new_session.user_id] = _to_entry(new_session)
+        return new_session
+
+    def update_session(self, session:Session, **fields):
+        with self._lock:
+            entry = self._sessions.get(session.user_id)
+            if entry is None or entry[0] != session.session_key:
+                return
+            updated = _to_session(session.user_id, entry)
+            for name, value in fields.items():
+                setattr(updated, name, value)
+            self._sessions[session.user_id] = _to_entry(updated)
+
+    def delete_sessions(self, user_id:str)->int:
+        with self._lock:
+            return int(self._sessions.pop(user_id, None) is not None)
+
+    def get_sessions_expiring_after(self, expires_at:datetime, user_ids:list=None)->list:
+        user_ids = None if user_ids is None else set(user_ids)
+        with self._lock:
+            return [
+                _to_session(user_id, entry) for user_id, entry in self._sessions.items()
+                if entry[1] >= expires_at and (user_ids is None or user_id in user_ids)
+            ]
+
+    def delete_sessions_of_users(self, user_ids:list)->int:
+        with self._lock:
+            return sum(self._sessions.pop(user_id, None) is not None for user_id in user_ids)
+
+    def delete_sessions_expiring_before(self, expires_at:datetime)->int:
+        with self._lock:
+            expired = [user_id for user_id, entry in self._sessions.items() if entry[1] < expires_at]
+            for user_id in expired:
+                del self._sessions[user_id]
+        return len(expired)
+
+    def delete_all_sessions(self)->int:
+        with self._lock:
+            deleted = len(self._sessions)
+            self._sessions.clear()
+        return deleted
+
+    def as_async(self):
+        return InlineAsyncSessionStore(self)
+
+def _to_entry(session:Session)->tuple:
+    return (session.session_key, session.expires_at.replace(tzinfo=None), session.x_auth_token)
+
+def _to_session(user_id:str, entry:tuple)->Session:
+    return Session(user_id=user_id, session_key=entry[0], expires_at=entry[1], x_auth_token=entry[2])
@@ -0,0 +1,230 @@
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from django.conf import settings
+
+from ..models import Session
+from ..DjMongoAuthError import DjMongoAuthError
+from .InlineAsyncSessionStore import InlineAsyncSessionStore
+
+HEADER = struct.Struct("<8sII")
+MAGIC = b"DJMASESS"
+# state, expires_at (epoch seconds), user_id, session_key, x_auth_token; sized after the Session model fields
+SLOT = struct.Struct("<Bd B128s B255s H1024s")
+KEY = struct.Struct("<Bd B128s")
+EMPTY, USED, DELETED = 0, 1, 2
+
+# sessions in a memory-mapped file that every worker process of a host opens: lookups are a hash probe
+# in shared memory, writes take an flock on the file (POSIX only); sessions survive restarts but not the
+# loss of the file, and are not shared between hosts
+# the file is a fixed-size open addressing table of DJMONGOAUTH_SESSION_STORE_SLOTS slots keyed by user_id;
+# size it well above the number of users with a session at any one time
+class MmapSessionStore():
+    def __init__(self, path:str=None, slots:int=None):
+        self.path = path or getattr(
+            settings,
+            "DJMONGOAUTH_SESSION_STORE_PATH",
+            os.path.join(tempfile.gettempdir(), "djmongoauth-sessions")
+        )
+        self.slots = slots or getattr(settings, "DJMONGOAUTH_SESSION_STORE_SLOTS", 16384)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def get_active_session(self, user_id:str, session_key:str):
+        with self._locked(fcntl.LOCK_SH):
+            index = self._find(user_id)
+            if index is None:
+                return None
+            session = self._read(index)
+        if session.session_key != session_key or session.has_expired():
+            return None
+        return session
+
+    def get_active_sessions(self, user_id:str)->list:
+        with self._locked(fcntl.LOCK_SH):
+            index = self._find(user_id)
+            session = None if index is None else self._read(index)
+        return [session] if session and not session.has_expired() else []
+
+    def get_or_create_session(self, new_session:Session)->Session:
+        with self._locked(fcntl.LOCK_EX):
+            index, free = self._probe(new_session.user_id)
+            if index is not None:
+                session = self._read(index)
+                if not session.has_expired():
+                    return session
+            elif free is None:
+                raise DjMongoAuthError("Session store {} is full".format(self.path))
+            self._write(free if index is None else index, new_session)
+        return new_session
+
+    def update_session(self, session:Session, **fields):
+        with self._locked(fcntl.LOCK_EX):
+            index = self._find(session.user_id)
+            if index is None:
+                return
+            updated = self._read(index)
+            if updated.session_key != session.session_key:
+                return
+            for name, value in fields.items():
+                setattr(updated, name, value)
+            self._write(index, updated)
+
+    def delete_sessions(self, user_id:str)->int:
+        return self.delete_sessions_of_users([user_id])
+
+    def get_sessions_expiring_after(self, expires_at:datetime, user_ids:list=None)->list:
+        timestamp = expires_at.replace(tzinfo=None).timestamp()
+        sessions = []
+        with self._locked(fcntl.LOCK_SH):
+            for index in range(self.slots):
+                state, slot_expires_at = struct.unpack_from("<Bd", self._map, self._offset(index))
+                if state == USED and slot_expires_at >= timestamp:
+                    sessions.append(self._read(index))
+        return [s for s in sessions if user_ids is None or s.user_id in user_ids]
+
+    def delete_sessions_of_users(self, user_ids:list)->int:
+        deleted = 0
+        with self._locked(fcntl.LOCK_EX):
+            for user_id in user_ids:
+                index = self._find(user_id)
+                if index is not None:
+                    self._free(index)
+                    deleted += 1
+        return deleted
+
+    def delete_sessions_expiring_before(self, expires_at:datetime)->int:
+        timestamp = expires_at.replace(tzinfo=None).timestamp()
+        deleted = 0
+        with self._locked(fcntl.LOCK_EX):
+            for index in range(self.slots):
+                state, slot_expires_at = struct.unpack_from("<Bd", self._map, self._offset(index))
+                if state == USED and slot_expires_at < timestamp:
+                    self._free(index)
+                    deleted += 1
+        return deleted
+
+    def delete_all_sessions(self)->int:
+        deleted = 0
+        with self._locked(fcntl.LOCK_EX):
+            for index in range(self.slots):
+                offset = self._offset(index)
+                deleted += self._map[offset] == USED
+                self._map[offset] = EMPTY
+        return deleted
+
+    def as_async(self):
+        return InlineAsyncSessionStore(self)
+
+    def _locked(self, operation:int):
+        self._open()
+        return _FileLock(self._lock, self._fd, operation)
+
+    def _open(self):
+        # a forked worker must not share the parent's open file: flock is held per open file description
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                size = HEADER.size + self.slots * SLOT.size
+                if os.fstat(fd).st_size == 0:
+                    # sparse file: pages are only allocated once a slot is written
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, HEADER.pack(MAGIC, self.slots, SLOT.size), 0)
+                magic, slots, slot_size = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                if magic != MAGIC or slots != self.slots or slot_size != SLOT.size:
+                    raise DjMongoAuthError("{} is not a session store with {} slots".format(self.path, self.slots))
+                self._map = mmap.mmap(fd, size)
+            except Exception:
+                # closing the file releases its flock
+                os.close(fd)
+                raise
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd = fd
+            self._pid = os.getpid()
+
+    def _offset(self, index:int)->int:
+        return HEADER.size + index * SLOT.size
+
+    def _probe(self, user_id:str)->tuple:
+        # (slot holding user_id or None, first slot a new session of user_id can go to or None if the table is full)
+        key = user_id.encode()
+        start = zlib.crc32(key) % self.slots
+        now = time.time()
+        free = None
+        for step in range(self.slots):
+            index = (start + step) % self.slots
+            state, expires_at, length, slot_key = KEY.unpack_from(self._map, self._offset(index))
+            if state == EMPTY:
+                return None, index if free is None else free
+            if state == USED and slot_key[:length] == key:
+                return index, free
+            if free is None and (state == DELETED or expires_at <= now):
+                # an expired session of another user is overwritten like a deleted one
+                free = index
+        return None, free
+
+    def _find(self, user_id:str):
+        return self._probe(user_id)[0]
+
+    def _read(self, index:int)->Session:
+        _, expires_at, user_id_length, user_id, key_length, session_key, token_length, token = SLOT.unpack_from(
+            self._map, self._offset(index)
+        )
+        return Session(
+            user_id=user_id[:user_id_length].decode(),
+            session_key=session_key[:key_length].decode(),
+            expires_at=datetime.fromtimestamp(expires_at),
+            x_auth_token=token[:token_length].decode() or None
+        )
+
+    def _write(self, index:int, session:Session):
+        user_id = session.user_id.encode()
+        session_key = session.session_key.encode()
+        token = (session.x_auth_token or "").encode()
+        if len(user_id) > 128 or len(session_key) > 255 or len(token) > 1024:
+            raise DjMongoAuthError("Session does not fit in a session store slot")
+        SLOT.pack_into(
+            self._map,
+            self._offset(index),
+            USED,
+            session.expires_at.replace(tzinfo=None).timestamp(),
+            len(user_id), user_id,
+            len(session_key), session_key,
+            len(token), token
+        )
+
+    def _free(self, index:int):
+        # a deleted slot keeps probe chains running past it, unless nothing follows it
+        self._map[self._offset(index)] = DELETED
+        while self._map[self._offset((index + 1) % self.slots)] == EMPTY and self._map[self._offset(index)] == DELETED:
+            self._map[self._offset(index)] = EMPTY
+            index = (index - 1) % self.slots
+
+class _FileLock():
+    # the thread lock serializes threads of this process, the flock other processes
+    def __init__(self, lock, fd:int, operation:int):
+        self.lock = lock
+        self.fd = fd
+        self.operation = operation
+
+    def __enter__(self):
+        self.lock.acquire()
+        fcntl.flock(self.fd, self.operation)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from ..repositories import get_repository, get_async_repository
+
+# sessions as documents of the Session collection, read and written through the configured repository
+class MongoSessionStore():
+    def get_active_session(self, user_id:str, session_key:str):
+        return get_repository().get_active_session(user_id=user_id, session_key=session_key)
+
+    def get_active_sessions(self, user_id:str)->list:
+        return get_repository().get_active_sessions(user_id)
+
+    def get_or_create_session(self, new_session):
+        return get_repository().get_or_create_session(new_session)
+
+    def update_session(self, session, **fields):
+        get_repository().update_session(session, **fields)
+
+    def delete_sessions(self, user_id:str)->int:
+        return get_repository().delete_sessions(user_id)
+
+    def get_sessions_expiring_after(self, expires_at:datetime, user_ids:list=None)->list:
+        return get_repository().get_sessions_expiring_after(expires_at, user_ids)
+
+    def delete_sessions_of_users(self, user_ids:list)->int:
+        return get_repository().delete_sessions_of_users(user_ids)
+
+    def delete_sessions_expiring_before(self, expires_at:datetime)->int:
+        return get_repository().delete_sessions_expiring_before(expires_at)
+
+    def delete_all_sessions(self)->int:
+        return get_repository().delete_all_sessions()
+
+    def as_async(self):
+        # the async repository has the same session methods as coroutines
+        return get_async_repository()
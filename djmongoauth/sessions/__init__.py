@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_session_store = None
+
+def get_session_store():
+    # DJMONGOAUTH_SESSION_STORE selects where sessions live: the Session collection in MongoDB (default),
+    # a per-process dict or a memory-mapped file shared by the worker processes of one host
+    global _session_store
+    if _session_store is None:
+        _session_store = import_string(getattr(
+            settings,
+            "DJMONGOAUTH_SESSION_STORE",
+            "djmongoauth.sessions.MongoSessionStore.MongoSessionStore"
+        ))()
+    return _session_store
+
+def get_async_session_store():
+    # the session store as used by the a* model methods and async views
+    return get_session_store().as_async()
@@ -0,0 +1,10 @@
+from django.http import Http404, HttpResponse
+
+from .common.Instrumentation import instrumentation, PrometheusSink
+
+def metrics(request):
+    # Prometheus scrape endpoint, available when PrometheusSink is in DJMONGOAUTH_INSTRUMENTATION_SINKS
+    sink = instrumentation.get_sink(PrometheusSink)
+    if sink is None:
+        raise Http404("Prometheus instrumentation sink is not configured")
+    return HttpResponse(sink.render(), content_type="text/plain; version=0.0.4")
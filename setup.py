@@ -20,9 +20,18 @@ setup(
 
     ],
     packages=find_packages(exclude=["test", "djmongouser_legacy"]),
+    package_data={
+        "djmongoauth": ["templates/djmongoauth/email/*"]
+    },
     zip_safe=False,
     install_requires=[
         "djongo==1.3.1",
         "Django>=2.2.24"
-    ]
+    ],
+    extras_require={
+        "benchmark": ["mongomock"],
+        "test": ["mongomock"],
+        "async": ["asgiref", "motor", "aiosmtplib"],
+        "redis": ["redis"]
+    }
 )
\ No newline at end of file
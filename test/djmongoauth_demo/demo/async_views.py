@@ -0,0 +1,82 @@
+from django.http import HttpResponse, JsonResponse
+import json 
+from djmongoauth.models import User
+from djmongoauth.common.EmailTypes import EmailTypes
+from djmongoauth.common.HashingPool import hashing_pool
+from djmongoauth.decorators.authenticated import authenticated
+
+# async views need Django >= 3.1; urls.py only routes them there
+# csrf_exempt is set as an attribute because the decorator returns a sync wrapper before Django 4.1
+
+async def register(request):
+    if request.method != "POST":
+        return HttpResponse(status=405)    # incorrect request method
+    req_body = json.loads(request.body.decode("UTF-8"))
+    user = User()
+    user.username = req_body["username"]
+    user.email = req_body["email"]
+    user.password = req_body["password"]
+    try:
+        await user.aregister()
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return HttpResponse(status=201)
+register.csrf_exempt = True
+
+async def login(request):
+    if request.method != "POST":
+        return HttpResponse(status=405)
+    try:
+        req_body = json.loads(request.body.decode("UTF-8"))
+        x_auth_token = await User.alogin(req_body["username"], req_body["password"], client_ip=request.META.get("REMOTE_ADDR"))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({"token": x_auth_token})
+login.csrf_exempt = True
+
+@authenticated()
+async def logout(request):
+    try:
+        await User.alogout(request)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return HttpResponse(status=204)
+logout.csrf_exempt = True
+
+@authenticated()
+async def verify_email(request):
+    if request.method == "POST":
+        try:
+            await User.asend_email(request, type=EmailTypes.VERIFY)
+            return HttpResponse(status=201)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=400)
+    elif request.method == "PUT":
+        try:
+            await User.ahandle_email_request(request, EmailTypes.VERIFY)
+            return HttpResponse(status=200)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=400)
+    else:
+        return HttpResponse(status=405)
+verify_email.csrf_exempt = True
+
+async def reset_password(request):
+    if request.method == "POST":
+        try:
+            await User.asend_email(request, type=EmailTypes.RESET)
+            return HttpResponse(status=200)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=400)
+    elif request.method == "PUT":
+        try:
+            await User.ahandle_email_request(request, EmailTypes.RESET)
+            return HttpResponse(status=200)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=400)
+    else:
+        return HttpResponse(status=405)
+reset_password.csrf_exempt = True
+
+def hashing_metrics(request):
+    return JsonResponse(hashing_pool.metrics())
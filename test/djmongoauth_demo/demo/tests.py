@@ -1,3 +1,733 @@
-from django.test import TestCase
+import calendar
+import json
+import os
+import random
+import tempfile
+import threading
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import check_password
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.template import Context, Engine
+from django.test import RequestFactory, TestCase, override_settings
+
+from djmongoauth.DjMongoAuthError import DjMongoAuthError
+from djmongoauth.common import Export, SessionAdmin
+from djmongoauth.common.AuthToken import AuthToken
+from djmongoauth.common.Email import Email
+from djmongoauth.common.EmailCooldown import EmailCooldown, email_cooldown
+from djmongoauth.common.EmailFactory import EmailFactory
+from djmongoauth.common.EmailQueue import EmailQueue
+from djmongoauth.common.EmailTypes import EmailTypes
+from djmongoauth.common.InvalidationBus import invalidation_bus
+from djmongoauth.common.RateLimiter import CacheRateLimitStore, LocalRateLimitStore, LoginThrottle
+from djmongoauth.common.SMTPConnectionPool import SMTPConnectionPool
+from djmongoauth.common.RevocationList import revocation_list
+from djmongoauth.common.SessionCompaction import compact_sessions
+from djmongoauth.common.TokenUtils import hash_session_key
+from djmongoauth.common.SessionCache import session_cache
+from djmongoauth.decorators.authenticated import authenticated
+from djmongoauth.models import User, Session, TemporaryAuthenticator
+from djmongoauth.repositories.MongoRepository import MongoRepository
+from djmongoauth.sessions.MemorySessionStore import MemorySessionStore
+from djmongoauth.sessions.MmapSessionStore import MmapSessionStore
+
+PASSWORD = "correct horse battery staple"
+
+@authenticated()
+def user_id_view(request):
+    return str(request.djmongoauth_user._id)
+
+class FlakyEmailBackend(BaseEmailBackend):
+    # appends to mail.outbox like the locmem backend; refuses the recipients in `refused`, drops the
+    # connection on the sends numbered in `drop_on` and cannot connect while `unreachable`
+    refused = set()
+    drop_on = set()
+    unreachable = False
+    sends = 0
+
+    def open(self):
+        if FlakyEmailBackend.unreachable:
+            raise ConnectionRefusedError("Connection refused")
+
+    def send_messages(self, messages):
+        for message in messages:
+            FlakyEmailBackend.sends += 1
+            if FlakyEmailBackend.sends in FlakyEmailBackend.drop_on:
+                raise SMTPServerDisconnected("Connection unexpectedly closed")
+            if message.to[0] in FlakyEmailBackend.refused:
+                raise SMTPRecipientsRefused({message.to[0]: (550, b"No such user")})
+            mail.outbox.append(message)
+        return len(messages)
+
+# run through djmongoauth.common.MongoMock.MongoMockTestRunner (TEST_RUNNER), which creates the collections
+class DjMongoAuthTestCase(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def register(self, username:str)->User:
+        user = User(username=username, email="{}@test.com".format(username), password=PASSWORD)
+        user.register()
+        return user
+
+    def sessions(self, token:str)->int:
+        return Session.objects.filter(user_id=Session.parse_x_auth_token(token)[1]).count()
+
+    def auth_request(self, token:str, method:str="get"):
+        return getattr(self.factory, method)("/", HTTP_AUTHORIZATION=token)
+
+    def send_email(self, token:str, type:EmailTypes)->str:
+        # returns the authenticator of the link that was sent
+        self.assertTrue(User.send_email(self.auth_request(token, "post"), type=type))
+        user_id = Session.parse_x_auth_token(token)[1]
+        return TemporaryAuthenticator.objects.get(user_id=user_id, email_type=type.value).authenticator
+
+    def email_request(self, authenticator:str, body:str):
+        return self.factory.put("/?a={}".format(authenticator), data=body, content_type="application/json")
+
+class LoginTest(DjMongoAuthTestCase):
+    def test_login_reuses_valid_session(self):
+        self.register("alice")
+        token = User.login("alice", PASSWORD)
+        self.assertEqual(User.login("alice", PASSWORD), token)
+        self.assertEqual(self.sessions(token), 1)
+
+    def test_login_replaces_expired_session(self):
+        self.register("bob")
+        token = User.login("bob", PASSWORD)
+        Session.objects.filter(user_id=Session.parse_x_auth_token(token)[1]).update(expires_at=datetime.now() - timedelta(hours=1))
+        new_token = User.login("bob", PASSWORD)
+        self.assertNotEqual(new_token, token)
+        self.assertEqual(self.sessions(new_token), 1)
+
+    def test_concurrent_logins_converge(self):
+        self.register("carol")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            tokens = set(executor.map(lambda _: User.login("carol", PASSWORD), range(32)))
+        self.assertEqual(len(tokens), 1)
+        self.assertEqual(self.sessions(tokens.pop()), 1)
+
+    def test_concurrent_logins_after_expiry_converge(self):
+        for repository in (None, MongoRepository()):
+            with self.subTest(repository=repository), mock.patch("djmongoauth.repositories._repository", repository):
+                username = "erik" if repository is None else "faith"
+                self.register(username)
+                for _ in range(5):
+                    token = User.login(username, PASSWORD)
+                    Session.objects.filter(user_id=AuthToken.parse(token).user_id).update(expires_at=datetime.now() - timedelta(hours=1))
+                    with ThreadPoolExecutor(max_workers=8) as executor:
+                        tokens = set(executor.map(lambda _: User.login(username, PASSWORD), range(8)))
+                    self.assertEqual(len(tokens), 1)
+                    self.assertNotEqual(tokens, {token})
+                    self.assertEqual(user_id_view(self.auth_request(tokens.pop())), AuthToken.parse(token).user_id)
+
+    def test_concurrent_logins_converge_with_mongo_repository(self):
+        self.register("dave")
+        with mock.patch("djmongoauth.repositories._repository", MongoRepository()):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                tokens = set(executor.map(lambda _: User.login("dave", PASSWORD), range(32)))
+        self.assertEqual(len(tokens), 1)
+        self.assertEqual(self.sessions(tokens.pop()), 1)
+
+class EmailRequestTest(DjMongoAuthTestCase):
+    def reset(self, authenticator:str, new_password:str):
+        User.handle_email_request(self.email_request(authenticator, json.dumps({"new_password": new_password})), EmailTypes.RESET)
+
+    def test_reset_link_works_once(self):
+        self.register("erin")
+        token = User.login("erin", PASSWORD)
+        authenticator = self.send_email(token, EmailTypes.RESET)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(authenticator, mail.outbox[0].body)
+        self.reset(authenticator, "new password 1")
+        with self.assertRaises(DjMongoAuthError):
+            self.reset(authenticator, "new password 2")
+        self.assertTrue(check_password("new password 1", User.objects.get(username="erin").password))
+        self.assertFalse(TemporaryAuthenticator.objects.filter(authenticator=authenticator).exists())
+        self.assertEqual(self.sessions(token), 0)
+
+    def test_verification_link_cannot_reset(self):
+        self.register("frank")
+        authenticator = self.send_email(User.login("frank", PASSWORD), EmailTypes.VERIFY)
+        with self.assertRaises(DjMongoAuthError):
+            self.reset(authenticator, "new password")
+        self.assertTrue(check_password(PASSWORD, User.objects.get(username="frank").password))
+        User.handle_email_request(self.email_request(authenticator, "{}"), EmailTypes.VERIFY)
+        self.assertTrue(User.objects.get(username="frank").email_verified)
+
+    def test_malformed_body_keeps_link(self):
+        self.register("grace")
+        authenticator = self.send_email(User.login("grace", PASSWORD), EmailTypes.RESET)
+        with self.assertRaises(DjMongoAuthError):
+            User.handle_email_request(self.email_request(authenticator, "not json"), EmailTypes.RESET)
+        self.reset(authenticator, "new password")
+        self.assertTrue(check_password("new password", User.objects.get(username="grace").password))
+
+    def test_concurrent_submissions_of_one_link(self):
+        self.register("heidi")
+        authenticator = self.send_email(User.login("heidi", PASSWORD), EmailTypes.RESET)
+
+        def attempt(i):
+            try:
+                self.reset(authenticator, "new password {}".format(i))
+                return i
+            except DjMongoAuthError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            winners = [i for i in executor.map(attempt, range(16)) if i is not None]
+        self.assertEqual(len(winners), 1)
+        self.assertTrue(check_password("new password {}".format(winners[0]), User.objects.get(username="heidi").password))
+
+class SessionCacheTest(DjMongoAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # the demo leaves the cache off
+        patcher = mock.patch.object(session_cache, "ttl", 60)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(session_cache.clear)
+        session_cache.clear()
+
+    def login_cached(self, username:str)->str:
+        # logs in and authenticates once, which caches the session
+        self.register(username)
+        token = User.login(username, PASSWORD)
+        user_id = user_id_view(self.auth_request(token))
+        self.assertEqual(session_cache.get(AuthToken.parse(token).session_key), user_id)
+        return token
+
+    def assertNotAuthenticated(self, token:str):
+        self.assertIsNone(session_cache.get(AuthToken.parse(token).session_key))
+        with self.assertRaises(DjMongoAuthError):
+            user_id_view(self.auth_request(token))
+
+    def test_cache_hit_skips_session_lookup(self):
+        token = self.login_cached("ivan")
+        Session.objects.filter(user_id=AuthToken.parse(token).user_id).delete()
+        # the entry stays until it is invalidated or expires
+        self.assertEqual(user_id_view(self.auth_request(token)), AuthToken.parse(token).user_id)
+
+    def test_logout_evicts_session(self):
+        token = self.login_cached("judy")
+        User.logout(self.auth_request(token, "post"))
+        self.assertNotAuthenticated(token)
+
+    def test_password_reset_evicts_session(self):
+        token = self.login_cached("mallory")
+        authenticator = self.send_email(token, EmailTypes.RESET)
+        User.handle_email_request(self.email_request(authenticator, json.dumps({"new_password": "new password"})), EmailTypes.RESET)
+        self.assertNotAuthenticated(token)
+
+    def test_revoking_user_sessions_evicts_session(self):
+        token = self.login_cached("niaj")
+        other = self.login_cached("olivia")
+        SessionAdmin.revoke_user_sessions([AuthToken.parse(token).user_id])
+        self.assertNotAuthenticated(token)
+        self.assertEqual(user_id_view(self.auth_request(other)), AuthToken.parse(other).user_id)
+
+class AuthTokenTest(DjMongoAuthTestCase):
+    TOKEN = "exp=1700000000&user_id=5f1d7a3c9b1e8a2d4c6f0b1a&username=alice&session_key=" + "k" * 171
+
+    def test_parse(self):
+        token = AuthToken.parse(self.TOKEN)
+        self.assertEqual(token, (1700000000, "5f1d7a3c9b1e8a2d4c6f0b1a", "alice", "k" * 171, self.TOKEN))
+        self.assertIs(AuthToken.parse(self.TOKEN), token)
+        self.assertEqual(AuthToken.parse(self.TOKEN + "&sig=" + "0" * 64).session_key, "k" * 171)
+
+    def test_malformed_tokens_rejected(self):
+        for malformed in ("Basic dXNlcjpwYXNzd29yZA==", "", self.TOKEN + "&admin=1", self.TOKEN + "&sig=0",
+                self.TOKEN.replace("5f1d", "5F1D"), self.TOKEN.replace("exp=", "exp=-"), self.TOKEN + "k" * 1024):
+            with self.subTest(malformed=malformed[:40]), self.assertRaisesRegex(DjMongoAuthError, "Failed to parse"):
+                AuthToken.parse(malformed)
+
+    def test_cache_emptied_when_full(self):
+        with mock.patch("djmongoauth.common.AuthToken.CACHE_SIZE", 2), \
+                mock.patch("djmongoauth.common.AuthToken._parsed", {}) as parsed:
+            tokens = [AuthToken.parse(self.TOKEN.replace("alice", name)) for name in ("bob", "carol", "dave")]
+            self.assertEqual(list(parsed.values()), [tokens[2]])
+            self.assertEqual(AuthToken.parse(tokens[0].raw), tokens[0])
+
+class SignedTokenTest(DjMongoAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        # DJMONGOAUTH_SIGNED_TOKENS is read at import time
+        for module in ("djmongoauth.models", "djmongoauth.decorators.authenticated", "djmongoauth.common.SessionAdmin"):
+            patcher = mock.patch(module + ".SIGNED_TOKENS", True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        revocation_list.cache.clear()
+        self.addCleanup(revocation_list.cache.clear)
+
+    def login(self, username:str)->str:
+        self.register(username)
+        token = User.login(username, PASSWORD)
+        self.assertIn("&sig=", token)
+        return token
+
+    def issue_second(self, token:str)->datetime:
+        # naive UTC start of the second the token was issued in
+        return datetime.utcfromtimestamp(AuthToken.parse(token).exp - int(Session.get_lifetime().total_seconds()))
+
+    def revoke_in_issue_second(self, token:str):
+        # runs the next revocation late in the second the token was issued in, after the login
+        now = self.issue_second(token) + timedelta(milliseconds=999)
+
+        class LateInSecond(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return now
+
+        patcher = mock.patch("djmongoauth.common.SessionAdmin.datetime", LateInSecond)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertRevoked(self, token:str):
+        with self.assertRaisesRegex(DjMongoAuthError, "revoked"):
+            user_id_view(self.auth_request(token))
+
+    def assertAuthenticated(self, token:str):
+        self.assertEqual(user_id_view(self.auth_request(token)), AuthToken.parse(token).user_id)
+
+    def test_verified_without_session_lookup(self):
+        token = self.login("peggy")
+        Session.objects.filter(user_id=AuthToken.parse(token).user_id).delete()
+        self.assertAuthenticated(token)
+
+    def test_tampered_signature_rejected(self):
+        token = self.login("rupert")
+        tampered = token.replace("username=rupert", "username=trent")
+        with self.assertRaisesRegex(DjMongoAuthError, "signature"):
+            user_id_view(self.auth_request(tampered))
+
+    def test_logout_revokes_token(self):
+        token = self.login("sybil")
+        User.logout(self.auth_request(token, "post"))
+        self.assertRevoked(token)
+        self.assertAuthenticated(User.login("sybil", PASSWORD))
+
+    def test_revoke_user_sessions(self):
+        token = self.login("trudy")
+        other = self.login("victor")
+        self.revoke_in_issue_second(token)
+        SessionAdmin.revoke_user_sessions([AuthToken.parse(token).user_id])
+        self.assertRevoked(token)
+        self.assertAuthenticated(other)
+
+    def test_revoke_sessions_issued_before(self):
+        token = self.login("walter")
+        SessionAdmin.revoke_sessions_issued_before(datetime.utcnow() - timedelta(hours=1))
+        self.assertAuthenticated(token)
+        # the token may have been issued at any point of its second
+        SessionAdmin.revoke_sessions_issued_before(self.issue_second(token))
+        self.assertAuthenticated(token)
+        SessionAdmin.revoke_sessions_issued_before(self.issue_second(token) + timedelta(milliseconds=999))
+        self.assertRevoked(token)
+
+    def test_revocation_from_another_process_uses_its_timestamp(self):
+        token = self.login("yvonne")
+        user_id = AuthToken.parse(token).user_id
+        issued = calendar.timegm(self.issue_second(token).utctimetuple())
+        # as received from another process, which revoked the user's sessions at the given second
+        invalidation_bus._receive("\n".join(["another-process", "user", str(issued - 5), user_id]).encode())
+        self.assertAuthenticated(token)
+        invalidation_bus._receive("\n".join(["another-process", "user", str(issued + 1), user_id]).encode())
+        self.assertRevoked(token)
+
+    def test_revoke_all_sessions(self):
+        tokens = [self.login("wendy"), self.login("xavier")]
+        self.revoke_in_issue_second(tokens[1])
+        SessionAdmin.revoke_all_sessions()
+        for token in tokens:
+            self.assertRevoked(token)
+
+class CompactSessionTest(DjMongoAuthTestCase):
+    def compact(self):
+        # DJMONGOAUTH_COMPACT_SESSIONS is read at import time
+        for module in ("djmongoauth.models", "djmongoauth.common.TokenUtils"):
+            patcher = mock.patch(module + ".COMPACT_SESSIONS", True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stored_session(self, token:str)->Session:
+        return Session.objects.get(user_id=AuthToken.parse(token).user_id)
+
+    def test_login_round_trip(self):
+        self.compact()
+        self.register("yvonne")
+        token = User.login("yvonne", PASSWORD)
+        session = self.stored_session(token)
+        self.assertIsNone(session.x_auth_token)
+        self.assertEqual(session.session_key, hash_session_key(AuthToken.parse(token).session_key))
+        # the token is rebuilt from the stored session on the next login
+        self.assertEqual(User.login("yvonne", PASSWORD), token)
+        self.assertEqual(user_id_view(self.auth_request(token)), session.user_id)
+        User.logout(self.auth_request(token, "post"))
+        with self.assertRaises(DjMongoAuthError):
+            user_id_view(self.auth_request(token))
+
+    def test_compacted_legacy_session_keeps_working(self):
+        self.register("zoe")
+        token = User.login("zoe", PASSWORD)
+        self.assertEqual(self.stored_session(token).x_auth_token, token)
+        self.compact()
+        self.assertEqual(compact_sessions(Session).compacted, 1)
+        session = self.stored_session(token)
+        self.assertIsNone(session.x_auth_token)
+        self.assertEqual(session.session_key, hash_session_key(AuthToken.parse(token).session_key))
+        self.assertEqual(user_id_view(self.auth_request(token)), session.user_id)
+        # its random key cannot be rebuilt, so a new login replaces the session
+        new_token = User.login("zoe", PASSWORD)
+        self.assertNotEqual(new_token, token)
+        self.assertEqual(user_id_view(self.auth_request(new_token)), session.user_id)
+        with self.assertRaises(DjMongoAuthError):
+            user_id_view(self.auth_request(token))
+
+@override_settings(EMAIL_BACKEND="demo.tests.FlakyEmailBackend")
+class SMTPConnectionPoolTest(DjMongoAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        FlakyEmailBackend.refused = set()
+        FlakyEmailBackend.drop_on = set()
+        FlakyEmailBackend.unreachable = False
+        FlakyEmailBackend.sends = 0
+        self.pool = SMTPConnectionPool(size=2, batch_size=2)
+
+    def emails(self, *names):
+        return [Email("Hello", text_message="Hi", from_email="noreply@test.com", to_email=name + "@test.com") for name in names]
+
+    def recipients(self)->list:
+        return [message.to[0] for message in mail.outbox]
+
+    def test_refused_recipient_does_not_stop_the_others(self):
+        FlakyEmailBackend.refused = {"bad@test.com"}
+        with self.assertLogs("djmongoauth.common.SMTPConnectionPool", "WARNING"):
+            result = self.pool.send_emails(self.emails("a", "bad", "b", "c", "d"))
+        self.assertEqual(self.recipients(), ["a@test.com", "b@test.com", "c@test.com", "d@test.com"])
+        self.assertEqual(result.sent, 4)
+        self.assertEqual([email.to_email for email, _ in result.failed], ["bad@test.com"])
+        self.assertIsInstance(result.failed[0][1], SMTPRecipientsRefused)
+
+    def test_dropped_connection_sends_only_the_rest(self):
+        FlakyEmailBackend.drop_on = {2}
+        with self.assertLogs("djmongoauth.common.SMTPConnectionPool", "WARNING"):
+            result = self.pool.send_emails(self.emails("a", "b", "c"))
+        self.assertEqual(self.recipients(), ["a@test.com", "b@test.com", "c@test.com"])
+        self.assertEqual((result.sent, result.failed), (3, []))
+
+    def test_unreachable_server_fails_every_email(self):
+        FlakyEmailBackend.unreachable = True
+        with self.assertLogs("djmongoauth.common.SMTPConnectionPool", "WARNING"):
+            result = self.pool.send_emails(self.emails("a", "b", "c"))
+            with self.assertRaises(ConnectionRefusedError):
+                self.pool.send_email(self.emails("a")[0])
+        self.assertEqual((result.sent, self.recipients()), (0, []))
+        self.assertEqual(len(result.failed), 3)
+
+    def test_send_bulk_email_reports_failures(self):
+        users = [self.register(name) for name in ("quinn", "robin", "sam")]
+        FlakyEmailBackend.refused = {"robin@test.com"}
+        with mock.patch("djmongoauth.models.smtp_pool", self.pool), self.assertLogs("djmongoauth.common.SMTPConnectionPool", "WARNING"):
+            result = User.send_bulk_email(users, EmailTypes.VERIFY)
+        self.assertEqual(result.sent, 2)
+        self.assertEqual(self.recipients(), ["quinn@test.com", "sam@test.com"])
+        self.assertEqual([email.to_email for email, _ in result.failed], ["robin@test.com"])
+
+class EmailFactoryTest(DjMongoAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        EmailFactory._templates.clear()
+        self.addCleanup(EmailFactory._templates.clear)
+        self.user = User(username="<b>O'Neil & \"co\" {0}</b>", email="oneil@test.com")
+        self.temp_auth = TemporaryAuthenticator(authenticator="a&b<c>", expires_at=datetime(2030, 1, 2, 3, 4, 5))
+
+    def test_shipped_templates_render_as_django_does(self):
+        engine = Engine(dirs=[EmailFactory.TEMPLATE_DIR])
+        for type in EmailTypes:
+            subject, path, name = EmailFactory.EMAILS[type]
+            fields = Context({
+                "username": self.user.username,
+                "site_url": EmailFactory.SITE_URL,
+                "link": "{}/{}?a={}".format(EmailFactory.BASE_URL, path, self.temp_auth.authenticator),
+                "expires_at": "2030-01-02 03:04:05"
+            })
+            email = EmailFactory.generate_email(type, user=self.user, temp_auth=self.temp_auth)
+            self.assertEqual(email.text_message, engine.get_template(name + ".txt").render(fields).strip())
+            self.assertEqual(email.html_message, engine.get_template(name + ".html").render(fields).strip())
+            self.assertIn(self.user.username, email.text_message)
+            self.assertIn("&lt;b&gt;O&#39;Neil &amp; &quot;co&quot; {0}&lt;/b&gt;", email.html_message)
+
+    def test_project_template_overrides_shipped_one(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, "djmongoauth", "email"))
+            with open(os.path.join(directory, "djmongoauth", "email", "verify.html"), "w") as f:
+                f.write("{% if username %}Hi {{ username|upper }}{% endif %} {{ link }}")
+            with override_settings(TEMPLATES=[{"BACKEND": "django.template.backends.django.DjangoTemplates", "DIRS": [directory]}]):
+                email = EmailFactory.generate_email(EmailTypes.VERIFY, user=self.user, temp_auth=self.temp_auth)
+        self.assertEqual(email.html_message, "Hi &lt;B&gt;O&#39;NEIL &amp; &quot;CO&quot; {0}&lt;/B&gt; " + EmailFactory.BASE_URL + "/verify?a=a&amp;b&lt;c&gt;")
+        self.assertTrue(email.text_message.startswith("Hello <b>O'Neil"))
+
+class EmailQueueTest(DjMongoAuthTestCase):
+    # sends through smtp_pool to the locmem backend the test runner configures
+    def emails(self, count:int)->list:
+        return [Email("Hello", text_message="Hi", from_email="noreply@test.com", to_email="{}@test.com".format(i)) for i in range(count)]
+
+    def test_send_email_is_delivered_by_the_queue(self):
+        email_queue = EmailQueue(workers=2, max_retries=1, backoff=0.01)
+        token = User.login(self.register("olivia").username, PASSWORD)
+        with mock.patch("djmongoauth.models.ASYNC_EMAIL", True), mock.patch("djmongoauth.models.email_queue", email_queue):
+            self.send_email(token, EmailTypes.VERIFY)
+        self.assertTrue(email_queue.join(timeout=5))
+        self.assertEqual([message.to for message in mail.outbox], [["olivia@test.com"]])
+        self.assertEqual((email_queue.sent, email_queue.failed), (1, 0))
+
+    def test_failed_email_retried_then_given_up(self):
+        attempts = []
+        def sender(email):
+            attempts.append(email.to_email)
+            raise SMTPServerDisconnected("Connection unexpectedly closed")
+        email_queue = EmailQueue(workers=1, max_retries=2, backoff=0.01, sender=sender)
+        with self.assertLogs("djmongoauth.common.EmailQueue", "WARNING") as logs:
+            email_queue.enqueue(self.emails(1)[0])
+            self.assertTrue(email_queue.join(timeout=5))
+        self.assertEqual((len(attempts), email_queue.sent, email_queue.failed), (3, 0, 1))
+        self.assertIn("Giving up", logs.output[-1])
+
+    def test_exit_waits_for_queued_emails(self):
+        email_queue = EmailQueue(workers=1, max_retries=0, backoff=0.01, shutdown_timeout=5)
+        for email in self.emails(3):
+            email_queue.enqueue(email)
+        email_queue._flush()
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_exit_gives_up_after_shutdown_timeout(self):
+        release = threading.Event()
+        email_queue = EmailQueue(workers=1, max_retries=0, backoff=0.01, sender=lambda email: release.wait(5), shutdown_timeout=0.1)
+        for email in self.emails(3):
+            email_queue.enqueue(email)
+        with self.assertLogs("djmongoauth.common.EmailQueue", "ERROR") as logs:
+            email_queue._flush()
+        release.set()
+        self.assertIn("3 queued emails not sent", logs.output[0])
+        self.assertTrue(email_queue.join(timeout=5))
+
+class ExportTest(DjMongoAuthTestCase):
+    def login(self, *usernames):
+        for username in usernames:
+            self.register(username)
+            User.login(username, PASSWORD)
+
+    def test_active_session_users(self):
+        self.register("zoe")
+        for store in (None, MemorySessionStore()):
+            with self.subTest(store=store), mock.patch("djmongoauth.sessions._session_store", store):
+                self.login("ada", "alan")
+                rows = sorted(Export.active_session_users(batch_size=1), key=lambda row: row["username"])
+                self.assertEqual([(row["username"], row["email"]) for row in rows], [("ada", "ada@test.com"), ("alan", "alan@test.com")])
+                self.assertEqual(len(list(Export.export_sessions(active_only=True))), 2)
+                self.assertEqual(Export.summary()["active_sessions"], 2)
+                User.objects.filter(username__in=["ada", "alan"]).delete()
+                Session.objects.all().delete()
+
+    def test_memory_store_warning(self):
+        self.assertIsNone(Export.session_store_warning())
+        with mock.patch("djmongoauth.sessions._session_store", MemorySessionStore()):
+            self.assertIn("memory store", Export.session_store_warning())
+
+class MmapSessionStoreTest(DjMongoAuthTestCase):
+    def store(self, slots:int)->MmapSessionStore:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return MmapSessionStore(path=os.path.join(directory.name, "sessions"), slots=slots)
+
+    def session(self, user_id:str, valid:bool=True)->Session:
+        expires_at = datetime.now() + (timedelta(hours=1) if valid else -timedelta(hours=1))
+        return Session(user_id=user_id, session_key=os.urandom(8).hex(), expires_at=expires_at)
+
+    def test_matches_a_dict(self):
+        # few slots, so that probe chains collide, wrap around and run over deleted and expired slots
+        users = ["user{}".format(i) for i in range(12)]
+        for seed in range(20):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                store = self.store(slots=16)
+                valid = {}    # user_id -> session_key of the valid sessions
+                for _ in range(300):
+                    user_id = rng.choice(users)
+                    operation = rng.random()
+                    if operation < 0.5:
+                        new_session = self.session(user_id, valid=rng.random() < 0.7)
+                        session = store.get_or_create_session(new_session)
+                        if user_id in valid:
+                            self.assertEqual(session.session_key, valid[user_id])
+                        else:
+                            self.assertIs(session, new_session)
+                            if not new_session.has_expired():
+                                valid[user_id] = new_session.session_key
+                    elif operation < 0.8:
+                        deleted = store.delete_sessions(user_id)
+                        self.assertEqual(deleted, 1) if user_id in valid else self.assertLessEqual(deleted, 1)
+                        valid.pop(user_id, None)
+                    elif operation < 0.9:
+                        deleted = rng.sample(users, 3)
+                        store.delete_sessions_of_users(deleted)
+                        for deleted_user_id in deleted:
+                            valid.pop(deleted_user_id, None)
+                    else:
+                        store.delete_sessions_expiring_before(datetime.now())
+                    for other in users:
+                        sessions = store.get_active_sessions(other)
+                        self.assertEqual([s.session_key for s in sessions], [valid[other]] if other in valid else [])
+                    self.assertEqual(
+                        {s.user_id: s.session_key for s in store.get_sessions_expiring_after(datetime.now())}, valid
+                    )
+
+    def test_deleted_slots_cleaned_up_backwards(self):
+        users = ["user{}".format(i) for i in range(5)]
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                store = self.store(slots=8)
+                for user_id in users:
+                    store.get_or_create_session(self.session(user_id))
+                deleted = random.Random(seed).sample(users, len(users))
+                for user_id in deleted[:-1]:
+                    store.delete_sessions(user_id)
+                self.assertEqual(store.get_active_sessions(deleted[-1])[0].user_id, deleted[-1])
+                store.delete_sessions(deleted[-1])
+                # once nothing follows them, tombstones go back to empty slots, and probes stop right away
+                self.assertEqual([store._map[store._offset(i)] for i in range(8)], [0] * 8)
+
+    def test_full_store(self):
+        store = self.store(slots=4)
+        for i in range(4):
+            store.get_or_create_session(self.session("user{}".format(i)))
+        with self.assertRaisesRegex(DjMongoAuthError, "full"):
+            store.get_or_create_session(self.session("user4"))
+        store.update_session(store.get_active_sessions("user2")[0], expires_at=datetime.now() - timedelta(seconds=1))
+        # the expired session of another user makes room
+        self.assertEqual(len(store.get_active_sessions("user4")), 0)
+        store.get_or_create_session(self.session("user4"))
+        self.assertEqual(len(store.get_active_sessions("user4")), 1)
+        self.assertEqual(store.get_active_sessions("user2"), [])
+
+class LoginThrottleTest(DjMongoAuthTestCase):
+    WINDOW = 100
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("djmongoauth.common.RateLimiter.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def throttles(self):
+        # the same limits on both stores, from the start of a window; the cache store uses the test's locmem cache
+        for store in (LocalRateLimitStore(), CacheRateLimitStore()):
+            if isinstance(store, CacheRateLimitStore):
+                store.cache.clear()
+            self.now = 1000.0
+            yield type(store).__name__, LoginThrottle(store, max_attempts=4, max_attempts_per_ip=6, window=self.WINDOW)
+
+    def blocked(self, throttle, username:str="mallory", client_ip:str=None)->bool:
+        try:
+            throttle.check(username, client_ip)
+            return False
+        except DjMongoAuthError:
+            return True
+
+    def test_sliding_window(self):
+        for name, throttle in self.throttles():
+            with self.subTest(store=name):
+                for _ in range(3):
+                    throttle.record_failure("mallory")
+                self.assertFalse(self.blocked(throttle))
+                throttle.record_failure("mallory")
+                self.assertTrue(self.blocked(throttle))
+                # the previous window counts in proportion to how much of it the sliding window still covers
+                self.now = 1100.0
+                self.assertTrue(self.blocked(throttle))
+                self.now = 1125.0
+                self.assertFalse(self.blocked(throttle))
+                throttle.record_failure("mallory")
+                self.assertTrue(self.blocked(throttle))
+                self.now = 1150.0
+                self.assertFalse(self.blocked(throttle))
+                # two windows later, nothing is left
+                self.now = 1300.0
+                for _ in range(3):
+                    throttle.record_failure("mallory")
+                self.assertFalse(self.blocked(throttle))
+
+    def test_success_clears_user_but_not_ip(self):
+        for name, throttle in self.throttles():
+            with self.subTest(store=name):
+                for _ in range(4):
+                    throttle.record_failure("mallory", "10.0.0.1")
+                throttle.record_success("mallory")
+                self.assertFalse(self.blocked(throttle, "mallory", "10.0.0.1"))
+                throttle.record_failure("trudy", "10.0.0.1")
+                throttle.record_failure("oscar", "10.0.0.1")
+                self.assertTrue(self.blocked(throttle, "peggy", "10.0.0.1"))
+                self.assertFalse(self.blocked(throttle, "peggy", "10.0.0.2"))
+
+    def test_local_store_prunes_old_counters(self):
+        store = LocalRateLimitStore()
+        with mock.patch.object(LocalRateLimitStore, "PRUNE_EVERY", 2):
+            store.incr("user:mallory", 10, self.WINDOW)
+            store.incr("user:trudy", 12, self.WINDOW)
+        self.assertEqual(list(store._counters), ["user:trudy"])
+
+class EmailCooldownTest(DjMongoAuthTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.register("ivan")
+        self.token = User.login("ivan", PASSWORD)
+        self.metrics = email_cooldown.metrics()[EmailTypes.RESET.value]
+
+    def outcomes(self)->dict:
+        metrics = email_cooldown.metrics()[EmailTypes.RESET.value]
+        return {outcome: metrics[outcome] - self.metrics[outcome] for outcome in EmailCooldown.OUTCOMES}
+
+    def sent_by_another_process(self, minutes_ago:int):
+        # as if the last email was sent minutes_ago by a process with its own record of recent sends
+        email_cooldown._last_sent.clear()
+        TemporaryAuthenticator.objects.filter(user_id=str(self.user._id)).update(
+            expires_at=datetime.now() + TemporaryAuthenticator.get_lifetime() - timedelta(minutes=minutes_ago)
+        )
+
+    def authenticators(self)->list:
+        return list(TemporaryAuthenticator.objects.filter(user_id=str(self.user._id)).values_list("authenticator", flat=True))
+
+    def test_repeated_request_suppressed(self):
+        authenticator = self.send_email(self.token, EmailTypes.RESET)
+        self.assertFalse(User.send_email(self.auth_request(self.token, "post"), type=EmailTypes.RESET))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.authenticators(), [authenticator])
+        self.assertEqual(self.outcomes(), {"sent": 1, "reused": 0, "suppressed": 1})
+
+    def test_email_sent_by_another_process_suppressed(self):
+        self.send_email(self.token, EmailTypes.RESET)
+        self.sent_by_another_process(minutes_ago=0)
+        self.assertFalse(User.send_email(self.auth_request(self.token, "post"), type=EmailTypes.RESET))
+        self.assertTrue(email_cooldown.is_cooling_down(str(self.user._id), EmailTypes.RESET))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_fresh_authenticator_reused_after_cooldown(self):
+        authenticator = self.send_email(self.token, EmailTypes.RESET)
+        self.sent_by_another_process(minutes_ago=10)
+        self.assertTrue(User.send_email(self.auth_request(self.token, "post"), type=EmailTypes.RESET))
+        self.assertEqual(self.authenticators(), [authenticator])
+        self.assertIn(authenticator, mail.outbox[1].body)
+        self.assertEqual(self.outcomes(), {"sent": 1, "reused": 1, "suppressed": 0})
+
+    def test_old_authenticator_replaced_after_cooldown(self):
+        authenticator = self.send_email(self.token, EmailTypes.RESET)
+        self.sent_by_another_process(minutes_ago=40)
+        self.assertTrue(User.send_email(self.auth_request(self.token, "post"), type=EmailTypes.RESET))
+        authenticators = self.authenticators()
+        self.assertEqual(len(authenticators), 2)
+        self.assertNotIn(authenticator, mail.outbox[1].body)
+        self.assertEqual(self.outcomes(), {"sent": 2, "reused": 0, "suppressed": 0})
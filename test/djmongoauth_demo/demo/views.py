@@ -4,6 +4,7 @@ from django.views.decorators.csrf import csrf_exempt
 from djmongoauth.models import User
 from djmongoauth.common.EmailTypes import EmailTypes
 from djmongoauth.decorators.authenticated import authenticated
+from djmongoauth.common.EmailCooldown import email_cooldown
 
 @csrf_exempt
 def register(request):
@@ -26,7 +27,7 @@ def login(request):
         return HttpResponse(status=405)
     try:
         req_body = json.loads(request.body.decode("UTF-8"))
-        x_auth_token = User.login(req_body["username"], req_body["password"])
+        x_auth_token = User.login(req_body["username"], req_body["password"], client_ip=request.META.get("REMOTE_ADDR"))
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
     return JsonResponse({"token": x_auth_token})
@@ -88,4 +89,5 @@ def _handle_password_recovery(request):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
-
+def email_metrics(request):
+    return JsonResponse(email_cooldown.metrics())
@@ -126,6 +126,10 @@ USE_TZ = True
 
 STATIC_URL = "/static/"
 
+# manage.py test runs against mongomock; set DJMONGOAUTH_TEST_MONGOMOCK=0 to test against DATABASES' server
+TEST_RUNNER = "djmongoauth.common.MongoMock.MongoMockTestRunner"
+DJMONGOAUTH_TEST_MONGOMOCK = os.environ.get("DJMONGOAUTH_TEST_MONGOMOCK", "1") != "0"
+
 # setting options for django email / djmongoauth
 SESSION_EXPIRE_IN_HOUR = 168 # one week
 SITE_URL = "test.com"
@@ -1,6 +1,9 @@
+import django
 from django.urls import path
 
-from demo.views import register, login, logout, verify_email, reset_password
+from demo.views import register, login, logout, verify_email, reset_password, email_metrics
+from demo import async_views
+from djmongoauth.views import metrics
 
 urlpatterns = [
     path(
@@ -22,5 +25,42 @@ urlpatterns = [
     path(
         route="reset",
         view=reset_password
+    ),
+    path(
+        route="metrics/hashing",
+        view=async_views.hashing_metrics
+    ),
+    path(
+        route="metrics/email",
+        view=email_metrics
+    ),
+    path(
+        route="metrics",
+        view=metrics
     )
 ]
+
+if django.VERSION >= (3, 1):
+    # older versions cannot serve async views
+    urlpatterns += [
+        path(
+            route="async/register",
+            view=async_views.register
+        ),
+        path(
+            route="async/login",
+            view=async_views.login
+        ),
+        path(
+            route="async/logout",
+            view=async_views.logout
+        ),
+        path(
+            route="async/verify",
+            view=async_views.verify_email
+        ),
+        path(
+            route="async/reset",
+            view=async_views.reset_password
+        )
+    ]